@@ -0,0 +1,431 @@
+# ==============================================================================
+# Copyright [2013] [Kevin Carter]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import BaseHTTPServer
+import SocketServer
+import hashlib
+import json
+import random
+import re
+import socket
+import threading
+import time
+import urlparse
+import uuid
+import zlib
+
+
+TENANT = '123456'
+
+
+def _iso(when=None):
+    when = when or time.time()
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(when))
+
+
+class FakeNova(object):
+    def __init__(self, servers=100, latency=0, server_size=0, max_limit=1000,
+                 error_rate=0, error_codes=(500, 503), regions=('RegionOne',),
+                 seed=None, compression=False):
+        """
+        An identity service and Nova API that run in this process, for
+        benchmarks. It answers "/tokens", "/servers", "/servers/detail",
+        "/servers/{id}", "/servers/{id}/action", "/images", "/flavors",
+        "/os-keypairs", "/os-networksv2" and "/limits".
+
+        "servers" is the number of servers that exist at the start and
+        "server_size" pads the metadata of each server to about that many
+        bytes. Every request waits "latency" seconds before it is answered.
+        Lists give at most "max_limit" items a page, with a "next" link. A
+        request fails with one of "error_codes" "error_rate" of the time,
+        between 0 and 1. The catalog has a Nova endpoint for each of
+        "regions", they all point at this server. If "compression" is True
+        replies are gzipped for clients that accept it. Gzipped request
+        bodies are always understood. Every GET reply has an "ETag" and a
+        request with a matching "If-None-Match" is answered "304".
+        """
+        self.latency = latency
+        self.server_size = server_size
+        self.max_limit = max_limit
+        self.error_rate = error_rate
+        self.error_codes = error_codes
+        self.regions = regions
+        self.random = random.Random(seed)
+        self.compression = compression
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.tokens = 0
+        self.servers = {}
+        self.deleted = {}
+        self.flavors = [{'id': str(flavor),
+                         'name': '%sMB Standard' % (256 * 2 ** flavor),
+                         'ram': 256 * 2 ** flavor,
+                         'disk': 10 * 2 ** flavor,
+                         'vcpus': flavor + 1}
+                        for flavor in range(8)]
+        self.images = [{'id': str(uuid.UUID(int=image)),
+                        'name': 'Image %s' % image,
+                        'status': 'ACTIVE'}
+                       for image in range(1, 21)]
+        self.keypairs = {}
+        self.networks = [{'id': str(uuid.UUID(int=1000 + net)),
+                          'label': 'network%s' % net,
+                          'cidr': '10.%s.0.0/24' % net}
+                         for net in range(3)]
+        for number in range(servers):
+            self.add_server(name='server%s' % number,
+                            flavor=self.flavors[number % 8]['id'],
+                            image=self.images[number % 20]['id'],
+                            status='ACTIVE')
+        self.httpd = None
+        self.thread = None
+
+    def add_server(self, name, flavor, image, status='BUILD', metadata=None,
+                   reservation_id=None):
+        server_id = str(uuid.uuid4())
+        metadata = dict(metadata or {})
+        if self.server_size:
+            metadata['padding'] = 'x' * self.server_size
+        self.servers[server_id] = {
+            'id': server_id,
+            'name': name,
+            'status': status,
+            'flavor': {'id': flavor},
+            'image': {'id': image},
+            'metadata': metadata,
+            'addresses': {'public': [{'version': 4, 'addr': '198.51.100.1'}],
+                          'private': [{'version': 4, 'addr': '10.0.0.1'}]},
+            'tenant_id': TENANT,
+            'reservation_id': reservation_id or 'r-%s' % server_id[:8],
+            'updated': _iso(),
+            'created': _iso()
+        }
+        return server_id
+
+    def start(self, host='127.0.0.1', port=0):
+        self.httpd = _Server((host, port), _Handler)
+        self.httpd.nova = self
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    @property
+    def url(self):
+        return 'http://%s:%s' % self.httpd.server_address
+
+    def m_args(self, **kwargs):
+        """
+        Return the "m_args" for a NovaCommands that uses this server.
+        """
+        m_args = {'os_user': 'benchmark',
+                  'os_apikey': 'benchmark',
+                  'os_password': 'benchmark',
+                  'os_tenant': TENANT,
+                  'os_auth_url': '%s/v2.0' % self.url,
+                  'os_rax_auth': None,
+                  'os_verbose': None,
+                  'os_region': self.regions[0],
+                  'os_version': 'v2.0'}
+        m_args.update(kwargs)
+        return m_args
+
+    def catalog(self):
+        return [{'name': 'cloudServersOpenStack',
+                 'type': 'compute',
+                 'endpoints': [{'region': region,
+                                'tenantId': TENANT,
+                                'publicURL': '%s/v2/%s' % (self.url, TENANT)}
+                               for region in self.regions]}]
+
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        # Replies are written in more than one piece, do not wait to send them
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, data=None, headers=None):
+        body = ''
+        if data is not None:
+            body = json.dumps(data)
+        if self.command == 'GET' and status == 200:
+            etag = '"%s"' % hashlib.md5(body).hexdigest()
+            headers = dict(headers or {}, ETag=etag)
+            if self.headers.get('if-none-match') == etag:
+                status, body = 304, ''
+        accept = self.headers.get('accept-encoding') or ''
+        if body and self.server.nova.compression and 'gzip' in accept:
+            compressor = zlib.compressobj(6, zlib.DEFLATED,
+                                          16 + zlib.MAX_WBITS)
+            body = compressor.compress(body) + compressor.flush()
+            headers = dict(headers or {}, **{'Content-Encoding': 'gzip'})
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _body(self):
+        length = int(self.headers.get('content-length') or 0)
+        if not length:
+            return {}
+        body = self.rfile.read(length)
+        if self.headers.get('content-encoding') == 'gzip':
+            body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        return json.loads(body)
+
+    def _handle(self, method):
+        nova = self.server.nova
+        body = self._body()
+        if nova.latency:
+            time.sleep(nova.latency)
+        with nova.lock:
+            nova.requests += 1
+            fail = nova.error_rate and nova.random.random() < nova.error_rate
+            if fail:
+                nova.errors += 1
+        if fail:
+            status = nova.random.choice(nova.error_codes)
+            return self._reply(status,
+                               {'computeFault': {'code': status,
+                                                 'message': 'Injected'}},
+                               headers={'Retry-After': '0'})
+
+        url = urlparse.urlparse(self.path)
+        query = dict((key, value[-1]) for key, value
+                     in urlparse.parse_qs(url.query).items())
+        path = url.path.rstrip('/')
+        if path.endswith('/tokens') and method == 'POST':
+            return self._tokens()
+
+        match = re.match(r'^/v2/[^/]+(/.*)$', path)
+        if not match:
+            return self._reply(*NOT_FOUND)
+        path = match.group(1)
+        for route, handler in ROUTES:
+            found = re.match(route, '%s %s' % (method, path))
+            if found:
+                with nova.lock:
+                    reply = handler(nova, query, body, *found.groups())
+                return self._reply(*reply)
+        return self._reply(*NOT_FOUND)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+    def _tokens(self):
+        nova = self.server.nova
+        with nova.lock:
+            nova.tokens += 1
+            token = 'token-%s' % nova.tokens
+        self._reply(200, {'access': {
+            'token': {'id': token,
+                      'expires': _iso(time.time() + 86400),
+                      'tenant': {'id': TENANT, 'name': TENANT}},
+            'user': {'id': 'benchmark', 'name': 'benchmark', 'roles': []},
+            'serviceCatalog': nova.catalog()}})
+
+
+# Every route is given the FakeNova, the query, the request body and the
+# groups of its regex. It returns the status and the data of the reply, the
+# FakeNova is locked while it runs.
+
+NOT_FOUND = (404, {'itemNotFound': {'code': 404, 'message': 'Not Found'}})
+
+
+def _page(nova, query, collection, items, base):
+    """
+    Return one page of "items" using the "limit" and "marker" in the query.
+    """
+    limit = min(int(query.get('limit') or nova.max_limit), nova.max_limit)
+    if 'marker' in query:
+        ids = [item['id'] for item in items]
+        if query['marker'] in ids:
+            items = items[ids.index(query['marker']) + 1:]
+    page = items[:limit]
+    data = {collection: page}
+    if len(items) > limit:
+        data['%s_links' % collection] = [{
+            'rel': 'next',
+            'href': '%s/v2/%s%s?limit=%s&marker=%s'
+                    % (nova.url, TENANT, base, limit, page[-1]['id'])
+        }]
+    return 200, data
+
+
+def servers_list(nova, query, body, detail):
+    servers = nova.servers.values()
+    if 'changes-since' in query:
+        servers = [server for server in servers + nova.deleted.values()
+                   if server['updated'] >= query['changes-since']]
+    for key in ('status', 'name', 'reservation_id'):
+        if key in query:
+            servers = [server for server in servers
+                       if server.get(key) == query[key]]
+    servers.sort(key=lambda item: item['id'])
+    if not detail:
+        servers = [{'id': server['id'], 'name': server['name']}
+                   for server in servers]
+    return _page(nova, query, 'servers', servers,
+                 '/servers%s' % (detail or ''))
+
+
+def server_show(nova, query, body, server_id):
+    if server_id not in nova.servers:
+        return NOT_FOUND
+    return 200, {'server': nova.servers[server_id]}
+
+
+def server_create(nova, query, body):
+    request = body.get('server', {})
+    reservation_id = 'r-%s' % uuid.uuid4().hex[:8]
+    server_ids = [nova.add_server(name=request.get('name'),
+                                  flavor=request.get('flavorRef'),
+                                  image=request.get('imageRef'),
+                                  metadata=request.get('metadata'),
+                                  reservation_id=reservation_id)
+                  for _ in range(int(request.get('max_count') or 1))]
+    if request.get('return_reservation_id'):
+        return 202, {'reservation_id': reservation_id}
+    return 202, {'server': {'id': server_ids[0], 'adminPass': 'benchmark'}}
+
+
+def server_delete(nova, query, body, server_id):
+    server = nova.servers.pop(server_id, None)
+    if server is None:
+        return NOT_FOUND
+    server['status'] = 'DELETED'
+    server['updated'] = _iso()
+    nova.deleted[server_id] = server
+    return (204,)
+
+
+def server_action(nova, query, body, server_id):
+    server = nova.servers.get(server_id)
+    if server is None:
+        return NOT_FOUND
+    if 'reboot' in body:
+        if body['reboot'].get('type') == 'HARD':
+            server['status'] = 'HARD_REBOOT'
+        else:
+            server['status'] = 'REBOOT'
+    elif 'resize' in body:
+        server['status'] = 'VERIFY_RESIZE'
+    elif 'confirmResize' in body or 'revertResize' in body:
+        server['status'] = 'ACTIVE'
+    elif 'createImage' in body:
+        image_id = str(uuid.uuid4())
+        nova.images.append({'id': image_id,
+                            'name': body['createImage'].get('name'),
+                            'status': 'SAVING',
+                            'server': {'id': server_id}})
+        server['updated'] = _iso()
+        return 202, None, {'Location': '%s/v2/%s/images/%s'
+                                       % (nova.url, TENANT, image_id)}
+    server['updated'] = _iso()
+    return (202,)
+
+
+def images_list(nova, query, body, detail):
+    return _page(nova, query, 'images', nova.images,
+                 '/images%s' % (detail or ''))
+
+
+def image_show(nova, query, body, image_id):
+    for image in nova.images:
+        if image['id'] == image_id:
+            return 200, {'image': image}
+    return NOT_FOUND
+
+
+def image_delete(nova, query, body, image_id):
+    nova.images = [image for image in nova.images if image['id'] != image_id]
+    return (204,)
+
+
+def flavors_list(nova, query, body, detail):
+    return _page(nova, query, 'flavors', nova.flavors,
+                 '/flavors%s' % (detail or ''))
+
+
+def keypairs_list(nova, query, body):
+    return 200, {'keypairs': [{'keypair': keypair} for keypair
+                              in nova.keypairs.values()]}
+
+
+def keypair_create(nova, query, body):
+    name = body.get('keypair', {}).get('name') or str(uuid.uuid4())
+    nova.keypairs[name] = {'name': name,
+                           'fingerprint': 'benchmark',
+                           'public_key': 'ssh-rsa benchmark'}
+    return 200, {'keypair': dict(nova.keypairs[name],
+                                 private_key='benchmark')}
+
+
+def keypair_delete(nova, query, body, name):
+    if nova.keypairs.pop(name, None) is None:
+        return NOT_FOUND
+    return (202,)
+
+
+def networks_list(nova, query, body):
+    return 200, {'networks': nova.networks}
+
+
+def limits(nova, query, body):
+    return 200, {'limits': {'rate': [], 'absolute': {}}}
+
+
+ROUTES = [(r'^GET /servers(/detail)?$', servers_list),
+          (r'^GET /servers/([^/]+)$', server_show),
+          (r'^POST /servers$', server_create),
+          (r'^DELETE /servers/([^/]+)$', server_delete),
+          (r'^POST /servers/([^/]+)/action$', server_action),
+          (r'^GET /images(/detail)?$', images_list),
+          (r'^GET /images/([^/]+)$', image_show),
+          (r'^DELETE /images/([^/]+)$', image_delete),
+          (r'^GET /flavors(/detail)?$', flavors_list),
+          (r'^GET /os-keypairs$', keypairs_list),
+          (r'^POST /os-keypairs$', keypair_create),
+          (r'^DELETE /os-keypairs/([^/]+)$', keypair_delete),
+          (r'^GET /os-networksv2$', networks_list),
+          (r'^GET /limits$', limits)]
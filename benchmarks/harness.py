@@ -0,0 +1,529 @@
+# ==============================================================================
+# Copyright [2013] [Kevin Carter]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import gc
+import json
+import optparse
+import os
+import platform
+import StringIO
+import subprocess
+import sys
+import time
+import traceback
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Local Imports
+from benchmarks import fakenova
+from bookofnova import computelib, jsonstream, models, workers
+
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'results')
+
+
+def percentile(values, percent):
+    """
+    Return the "percent" percentile of "values", IE 50 for the median.
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    index = int(round(percent / 100.0 * (len(values) - 1)))
+    return values[index]
+
+
+def peak_rss():
+    """
+    Return the peak resident memory of this process in kilobytes, or None if
+    it can not be found on this platform.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak /= 1024
+    return peak
+
+
+def _timed(calls):
+    """
+    Make each of "calls" and return the seconds that each one took.
+    """
+    latencies = []
+    for call in calls:
+        started = time.time()
+        call()
+        latencies.append(time.time() - started)
+    return latencies
+
+
+def _drain(items):
+    """
+    Use every item without keeping any, like a caller that handles one server
+    at a time.
+    """
+    count = 0
+    for _ in items:
+        count += 1
+    return count
+
+
+def _hold(make, iterations):
+    """
+    Build and keep the list returned by "make", "iterations" times, so that
+    the peak memory shows what it costs to hold the items. Returns the
+    seconds each build took and the number of items that were held.
+    """
+    held = None
+    latencies = []
+    for _ in range(iterations):
+        held = None
+        started = time.time()
+        held = make()
+        latencies.append(time.time() - started)
+    return latencies, len(held or ())
+
+
+def _servers_json(fake):
+    return json.dumps({'servers': fake.servers.values()})
+
+
+def _check(action):
+    if not action['nova_status'] or action['nova_status'] >= 300:
+        raise computelib.RequestFailed('The benchmark call failed, STATUS %s'
+                                       % action['nova_status'],
+                                       action=action)
+    return action
+
+
+# Every benchmark is given a NovaCommands, the FakeNova and the options. It
+# returns a list of the seconds taken by each operation, or that list and the
+# number of items it kept in memory so the memory of each item can be found.
+
+def bench_auth(nova, fake, options):
+    return _timed(lambda: _check(nova.auth())
+                  for _ in range(options.iterations))
+
+
+def bench_server_info(nova, fake, options):
+    server_ids = fake.servers.keys()[:options.iterations]
+    return _timed(lambda server_id=server_id: _check(
+        nova.server_info(server_id)
+    ) for server_id in server_ids)
+
+
+def bench_server_list_detail(nova, fake, options):
+    return _timed(lambda: _drain(nova.iter_servers_detail())
+                  for _ in range(options.list_iterations))
+
+
+def bench_server_list_detail_stream(nova, fake, options):
+    return _timed(lambda: _drain(nova.iter_servers_detail(stream=True))
+                  for _ in range(options.list_iterations))
+
+
+def bench_server_list_detail_fields(nova, fake, options):
+    fields = ['id', 'name', 'status', 'flavor.id']
+    return _timed(lambda: _drain(nova.iter_servers_detail(fields=fields))
+                  for _ in range(options.list_iterations))
+
+
+def bench_server_dicts_held(nova, fake, options):
+    return _hold(lambda: list(nova.iter_servers_detail()),
+                 options.list_iterations)
+
+
+def bench_server_models_held(nova, fake, options):
+    return _hold(lambda: list(nova.iter_servers_detail(model=True)),
+                 options.list_iterations)
+
+
+def bench_server_models_stream_held(nova, fake, options):
+    return _hold(lambda: list(nova.iter_servers_detail(model=True,
+                                                       stream=True)),
+                 options.list_iterations)
+
+
+def bench_build_server_dicts(nova, fake, options):
+    """
+    Only the cost of building the items from the JSON, no requests are made.
+    """
+    text = _servers_json(fake)
+    return _timed(lambda: json.loads(text)['servers']
+                  for _ in range(options.list_iterations))
+
+
+def bench_build_server_models(nova, fake, options):
+    text = _servers_json(fake)
+    return _timed(lambda: [models.Server.from_dict(server) for server
+                           in json.loads(text)['servers']]
+                  for _ in range(options.list_iterations))
+
+
+def bench_build_server_models_stream(nova, fake, options):
+    text = _servers_json(fake)
+    fields = models.Server.projection()
+
+    def _build():
+        parser = jsonstream.StreamParser(StringIO.StringIO(text))
+        return [models.Server.from_dict(server) for server
+                in parser.iter_collection('servers', fields=fields)]
+    return _timed(_build for _ in range(options.list_iterations))
+
+
+def bench_flavor_list_detail(nova, fake, options):
+    return _timed(lambda: _check(nova.flavor_list_detail())
+                  for _ in range(options.iterations))
+
+
+def bench_image_list_detail(nova, fake, options):
+    return _timed(lambda: _check(nova.image_list_detail())
+                  for _ in range(options.iterations))
+
+
+def bench_image_list_detail_cached(nova, fake, options):
+    """
+    The same as "image_list_detail" with an HTTP cache, every call after the
+    first is answered "304 Not Modified".
+    """
+    nova = computelib.NovaCommands(
+        m_args=fake.m_args(pool_size=options.concurrency, http_cache=True),
+        log_level='error'
+    )
+    _check(nova.auth())
+    return _timed(lambda: _check(nova.image_list_detail())
+                  for _ in range(options.iterations))
+
+
+def bench_builder(nova, fake, options):
+    pay_load = {'name': 'benchmark',
+                'imageRef': fake.images[0]['id'],
+                'flavorRef': fake.flavors[1]['name'],
+                'metadata': {'benchmark': 'true'}}
+    return _timed(lambda: nova.builder(pay_load)
+                  for _ in range(options.iterations))
+
+
+def bench_booter(nova, fake, options):
+    body = nova.builder({'name': 'benchmark',
+                         'imageRef': fake.images[0]['id'],
+                         'flavorRef': fake.flavors[1]['id']})
+    return _timed(lambda: _check(nova.booter(body))
+                  for _ in range(options.iterations))
+
+
+def bench_booter_group(nova, fake, options):
+    """
+    One latency, the time to boot "iterations" servers with one multiple
+    server request and to find them by their reservation ID.
+    """
+    body = nova.builder({'name': 'benchmark',
+                         'imageRef': fake.images[0]['id'],
+                         'flavorRef': fake.flavors[1]['id'],
+                         'min_count': options.iterations,
+                         'max_count': options.iterations,
+                         'return_reservation_id': True})
+
+    def _boot():
+        action = _check(nova.booter(body))
+        servers = nova.reservation_servers(
+            action['nova_resp']['reservation_id']
+        )
+        if len(servers) != options.iterations:
+            raise computelib.RequestFailed('%s of %s servers were booted'
+                                           % (len(servers),
+                                              options.iterations))
+    return _timed([_boot])
+
+
+def bench_re_booter(nova, fake, options):
+    server_ids = fake.servers.keys()[:options.iterations]
+    return _timed(lambda server_id=server_id: _check(
+        nova.re_booter(server_id, hard_reboot=False)
+    ) for server_id in server_ids)
+
+
+def bench_server_nuker(nova, fake, options):
+    body = nova.builder({'name': 'benchmark',
+                         'imageRef': fake.images[0]['id'],
+                         'flavorRef': fake.flavors[1]['id']})
+    server_ids = [_check(nova.booter(body))['nova_resp']['server']['id']
+                  for _ in range(options.iterations)]
+    return _timed(lambda server_id=server_id: _check(
+        nova.server_nuker(server_id)
+    ) for server_id in server_ids)
+
+
+def bench_nuke_many(nova, fake, options):
+    """
+    One latency, the time to delete "iterations" servers with "concurrency"
+    deletes in flight and to confirm that they are gone.
+    """
+    body = nova.builder({'name': 'benchmark',
+                         'imageRef': fake.images[0]['id'],
+                         'flavorRef': fake.flavors[1]['id']})
+    server_ids = [_check(nova.booter(body))['nova_resp']['server']['id']
+                  for _ in range(options.iterations)]
+
+    def _nuke():
+        summary = nova.nuke_many(server_ids,
+                                 concurrency=options.concurrency,
+                                 interval=0.1)
+        if summary['failed'] or summary['timed_out']:
+            raise computelib.RequestFailed('%s deletes failed and %s timed out'
+                                           % (len(summary['failed']),
+                                              len(summary['timed_out'])))
+    return _timed([_nuke])
+
+
+def bench_concurrent_server_info(nova, fake, options):
+    """
+    Each latency is one call made while "concurrency" calls are in flight.
+    """
+    def _call(server_id):
+        started = time.time()
+        _check(nova.server_info(server_id))
+        return time.time() - started
+
+    server_ids = fake.servers.keys()[:options.iterations]
+    batch = workers.BatchMap(func=_call,
+                             items=server_ids,
+                             pool=workers.WorkerPool(options.concurrency),
+                             shutdown=True)
+    latencies = [latency for _, latency in batch]
+    if batch.errors:
+        raise batch.errors.values()[0]
+    return latencies
+
+
+BENCHMARKS = [('auth', bench_auth),
+              ('server_info', bench_server_info),
+              ('server_list_detail', bench_server_list_detail),
+              ('server_list_detail_stream', bench_server_list_detail_stream),
+              ('server_list_detail_fields', bench_server_list_detail_fields),
+              ('server_dicts_held', bench_server_dicts_held),
+              ('server_models_held', bench_server_models_held),
+              ('server_models_stream_held', bench_server_models_stream_held),
+              ('build_server_dicts', bench_build_server_dicts),
+              ('build_server_models', bench_build_server_models),
+              ('build_server_models_stream', bench_build_server_models_stream),
+              ('flavor_list_detail', bench_flavor_list_detail),
+              ('image_list_detail', bench_image_list_detail),
+              ('image_list_detail_cached', bench_image_list_detail_cached),
+              ('builder', bench_builder),
+              ('booter', bench_booter),
+              ('booter_group', bench_booter_group),
+              ('re_booter', bench_re_booter),
+              ('server_nuker', bench_server_nuker),
+              ('nuke_many', bench_nuke_many),
+              ('concurrent_server_info', bench_concurrent_server_info)]
+
+
+def run_benchmark(bench, fake, options):
+    """
+    Run one benchmark on a new, authenticated, NovaCommands and return its
+    results.
+    """
+    gc.collect()
+    baseline = peak_rss()
+    nova = computelib.NovaCommands(
+        m_args=fake.m_args(pool_size=options.concurrency),
+        log_level='error'
+    )
+    _check(nova.auth())
+    started = time.time()
+    latencies = bench(nova, fake, options)
+    seconds = time.time() - started
+    peak = peak_rss()
+    held = None
+    if isinstance(latencies, tuple):
+        latencies, held = latencies
+    result = {'operations': len(latencies),
+              'seconds': seconds,
+              'throughput': len(latencies) / seconds if seconds else None,
+              'p50': percentile(latencies, 50),
+              'p99': percentile(latencies, 99),
+              'peak_rss_kb': peak}
+    if peak is not None:
+        result['rss_growth_kb'] = peak - baseline
+        if held:
+            result['bytes_per_item'] = (peak - baseline) * 1024 / held
+    return result
+
+
+def isolated(func, *args):
+    """
+    Run "func" in a child process so that the peak memory it reports is its
+    own. The result has to be JSON. Where there is no "fork" it is run here.
+    """
+    if not hasattr(os, 'fork'):
+        return func(*args)
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            reply = {'result': func(*args)}
+        except Exception:
+            reply = {'error': traceback.format_exc()}
+        with os.fdopen(write_fd, 'w') as pipe:
+            pipe.write(json.dumps(reply))
+        os._exit(0)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd) as pipe:
+        reply = pipe.read()
+    os.waitpid(pid, 0)
+    if not reply:
+        raise RuntimeError('The benchmark process died without a result')
+    reply = json.loads(reply)
+    if 'error' in reply:
+        raise RuntimeError(reply['error'])
+    return reply['result']
+
+
+def _per_item(result):
+    if result.get('bytes_per_item') is None:
+        return ''
+    return '  %s bytes/item' % result['bytes_per_item']
+
+
+def git_commit():
+    """
+    Return the commit that is checked out, if this is a git checkout.
+    """
+    try:
+        proc = subprocess.Popen(['git', 'rev-parse', '--short', 'HEAD'],
+                                cwd=os.path.dirname(RESULTS_DIR),
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+        commit = proc.communicate()[0].strip()
+    except OSError:
+        return None
+    return commit or None
+
+
+def compare(current, previous):
+    """
+    Print the change of every result that is in both runs.
+    """
+    print('%-28s %12s %12s %12s %12s %12s' % ('benchmark', 'throughput',
+                                              'p50', 'p99', 'peak rss',
+                                              'per item'))
+    for name, result in sorted(current['results'].items()):
+        before = previous['results'].get(name)
+        if before is None or 'error' in result or 'error' in before:
+            continue
+        changes = []
+        for key in ('throughput', 'p50', 'p99', 'peak_rss_kb',
+                    'bytes_per_item'):
+            if result.get(key) is None or not before.get(key):
+                changes.append('-')
+            else:
+                changes.append('%+.1f%%' % ((result[key] - before[key]) * 100.0
+                                            / before[key]))
+        print('%-28s %12s %12s %12s %12s %12s' % tuple([name] + changes))
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(
+        usage='%prog [options]',
+        description='Benchmark bookofnova against an in process fake Nova.'
+    )
+    parser.add_option('--servers', type='int', default=1000,
+                      help='Servers in the fake account [%default]')
+    parser.add_option('--server-size', type='int', default=0,
+                      help='Bytes of metadata added to each server [%default]')
+    parser.add_option('--max-limit', type='int', default=1000,
+                      help='Most items in a page of a list [%default]')
+    parser.add_option('--latency', type='float', default=0,
+                      help='Seconds each request is delayed [%default]')
+    parser.add_option('--error-rate', type='float', default=0,
+                      help='Part of the requests that fail, 0 to 1 [%default]')
+    parser.add_option('--compression', action='store_true', default=False,
+                      help='Gzip the replies of the fake API')
+    parser.add_option('--iterations', type='int', default=200,
+                      help='Calls made by each benchmark [%default]')
+    parser.add_option('--list-iterations', type='int', default=5,
+                      help='Full lists made by each list benchmark'
+                           ' [%default]')
+    parser.add_option('--concurrency', type='int', default=10,
+                      help='Threads used by the concurrent benchmarks'
+                           ' [%default]')
+    parser.add_option('--only', action='append', default=[],
+                      help='Only run this benchmark, can be given many times')
+    parser.add_option('--output', default=RESULTS_DIR,
+                      help='Directory the results are saved in [%default]')
+    parser.add_option('--compare', metavar='FILE',
+                      help='Results of an earlier run to compare with')
+    options, _ = parser.parse_args(argv)
+
+    fake = fakenova.FakeNova(servers=options.servers,
+                             server_size=options.server_size,
+                             max_limit=options.max_limit,
+                             latency=options.latency,
+                             error_rate=options.error_rate,
+                             seed=0,
+                             compression=options.compression).start()
+    results = {}
+    try:
+        for name, bench in BENCHMARKS:
+            if options.only and name not in options.only:
+                continue
+            try:
+                results[name] = isolated(run_benchmark, bench, fake, options)
+            except Exception, exp:
+                results[name] = {'error': str(exp)}
+                print('%-28s FAILED\n%s' % (name, exp))
+                continue
+            result = results[name]
+            print('%-28s %8d ops %10.1f ops/s  p50 %8.2fms  p99 %8.2fms'
+                  '  peak %s KB%s' % (name, result['operations'],
+                                      result['throughput'] or 0,
+                                      (result['p50'] or 0) * 1000,
+                                      (result['p99'] or 0) * 1000,
+                                      result['peak_rss_kb'],
+                                      _per_item(result)))
+    finally:
+        fake.stop()
+
+    commit = git_commit()
+    run = {'commit': commit,
+           'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+           'python': platform.python_version(),
+           'platform': platform.platform(),
+           'options': options.__dict__,
+           'results': results}
+    if not os.path.isdir(options.output):
+        os.makedirs(options.output)
+    path = os.path.join(options.output, '%s-%s.json'
+                        % (time.strftime('%Y%m%d%H%M%S'), commit or 'nogit'))
+    with open(path, 'w') as results_file:
+        json.dump(run, results_file, indent=2, sort_keys=True)
+    print('Results saved to %s' % path)
+
+    if options.compare:
+        with open(options.compare) as previous:
+            compare(run, json.load(previous))
+
+
+if __name__ == '__main__':
+    main()
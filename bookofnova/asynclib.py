@@ -0,0 +1,104 @@
+# ==============================================================================
+# Copyright [2013] [Kevin Carter]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import inspect
+
+# Local Imports
+from bookofnova import computelib, workers
+
+
+class AsyncNovaCommands(object):
+    def __init__(self, m_args, log_file=None, log_level='info', output=None,
+                 concurrency=10):
+        """
+        Access the Nova API without waiting on it. Every method found on
+        "computelib.NovaCommands" is available here and takes the same
+        arguments, though instead of the result a "workers.Future" is returned
+        right away. Call "result()" on the future to get the value, or use
+        "workers.as_completed" / "workers.wait_all" on many futures.
+
+        At most "concurrency" calls are made at the same time, the rest are
+        queued. Each of the running calls has its own keep-alive connection to
+        the API. The arguments are the same as they are for
+        "computelib.NovaCommands", "m_args" is copied so the dictionary given
+        is not changed, use "nova.m_args" to see the token.
+
+        Example :
+        nova = AsyncNovaCommands(m_args=m_args, concurrency=50)
+        nova.auth().result()
+        futures = [nova.server_info(s_id) for s_id in server_ids]
+        for future in workers.as_completed(futures):
+            print(future.result())
+        """
+        m_args = dict(m_args)
+        m_args.setdefault('pool_size', concurrency)
+        self.nova = computelib.NovaCommands(m_args=m_args,
+                                            log_file=log_file,
+                                            log_level=log_level,
+                                            output=output)
+        self.m_args = self.nova.m_args
+        self.output = self.nova.output
+        self.workers = workers.WorkerPool(workers=concurrency)
+
+    def submit(self, method, *args, **kwargs):
+        """
+        Run the "computelib.NovaCommands" method named "method" on a worker
+        and return a Future for its result.
+        """
+        return self.workers.submit(getattr(self.nova, method), *args, **kwargs)
+
+    def map(self, method, items, ordered=True, **kwargs):
+        """
+        Run the method named "method" for every item in "items" on our
+        workers, see "computelib.NovaCommands.map".
+        """
+        return workers.BatchMap(func=getattr(self.nova, method),
+                                items=items,
+                                pool=self.workers,
+                                ordered=ordered,
+                                failed=computelib._failed,
+                                **kwargs)
+
+    def close(self):
+        """
+        Wait for the queued calls, stop the workers and close our connections.
+        """
+        self.workers.shutdown()
+        self.nova.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.close()
+
+
+def _mirror(name, method):
+    def _async(self, *args, **kwargs):
+        return self.submit(name, *args, **kwargs)
+    _async.__name__ = name
+    _async.__doc__ = method.__doc__
+    return _async
+
+
+# Mirror every public method of NovaCommands, generators are left out as they
+# already give their results back a piece at a time.
+for _name, _method in inspect.getmembers(computelib.NovaCommands,
+                                         inspect.ismethod):
+    if _name.startswith('_') or _name in AsyncNovaCommands.__dict__:
+        continue
+    elif inspect.isgeneratorfunction(_method):
+        continue
+    setattr(AsyncNovaCommands, _name, _mirror(_name, _method))
@@ -13,12 +13,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ==============================================================================
-import httplib
 import traceback
 import json
+import time
 
 # Local Import
-from bookofnova import connections, statuscodes, logger
+from bookofnova import connections, statuscodes, logger, tokencache
 
 
 class NoEndPointProvided(Exception):
@@ -84,10 +84,13 @@ class Authentication(object):
             else:
                 self.m_args['rackspace_auth'] = False
 
-            # Check to see if we are using HTTPS
+            # Check to see if we are using HTTPS, a URL without a protocol has
+            # already been sanitised by a previous authentication
             if self.m_args['os_auth_url'].startswith('https'):
                 self.m_args['use_https'] = True
-            else:
+            elif self.m_args['os_auth_url'].startswith('http'):
+                self.m_args['use_https'] = False
+            elif not 'use_https' in self.m_args:
                 self.m_args['use_https'] = False
 
         else:
@@ -123,33 +126,104 @@ class Authentication(object):
         self.m_args['url'] = url_data[0]
         return self.m_args, jsonreq
 
-    def os_auth(self):
+    def _token_cache(self):
+        """
+        Return a token cache if "m_args['token_cache']" has been set. The value
+        is the directory used to store the cache, if it is simply "True" the
+        cache will be kept in "~/.bookofnova".
+        """
+        cache_dir = self.m_args.get('token_cache')
+        if not cache_dir:
+            return None
+        elif cache_dir is True:
+            cache_dir = '~/.bookofnova'
+        return tokencache.TokenCache(cache_dir=cache_dir, output=self.output)
+
+    def os_auth(self, stale_token=None):
         """
         Set a DC Endpoint and Authentication URL for the Open Stack environment
-        Authentication can handle both HTTPS and HTTP Connections.
+        Authentication can handle both HTTPS and HTTP Connections. When the
+        token cache is enabled a valid cached token is used instead of
+        authenticating, the cache entry is locked while we authenticate so
+        that other processes will wait for, and then share, our token. If
+        "stale_token" is given the cached token is only used when it is not
+        the token that was rejected.
         """
         # Set Auth Sting and URL
         data = self.auth_set()
         self.m_args = data[0]
         jsonreq = data[1]
+
+        cache = self._token_cache()
+        if not cache:
+            return self._get_token(jsonreq=jsonreq)
+
+        key = cache.key(auth_url=self.m_args['os_auth_url'],
+                        user=self.m_args['os_user'],
+                        tenant=self.m_args.get('os_tenant'),
+                        region=self.m_args.get('os_region'))
+        with cache.lock(key):
+            cached = cache.load(key)
+            if cached and cached['token'] != stale_token:
+                self.output.info('Using a cached token')
+                self.m_args.update(cached)
+                self.m_args['nova_status'] = 200
+                self.m_args['nova_reason'] = 'Cached Token'
+                return self.m_args
+
+            auth = self._get_token(jsonreq=jsonreq)
+            if auth and auth['nova_status'] < 300 and 'token' in auth:
+                cache.save(key, auth)
+            return auth
+
+    def _get_token(self, jsonreq):
+        """
+        Post our credentials to the identity service and parse the response.
+        """
         self.connection = connections.Connections(m_args=self.m_args,
                                                   output=self.output)
         conn = self.connection._conn(self.m_args['url'])
 
         if self.m_args['os_verbose']:
-            self.output.debug('REQUEST:\t %s\nARGS:\t%s'
-                              % (jsonreq, self.m_args))
+            self.output.debug('REQUEST:\t %s\nARGS:\t%s',
+                              logger.Dump(jsonreq), self.m_args)
 
         headers = {'Content-Type': 'application/json'}
         tokenurl = '/%s/tokens' % self.m_args['os_version']
-        conn.request('POST', tokenurl, jsonreq, headers)
+        policy = self.connection.retry_policy
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                conn.request('POST', tokenurl, jsonreq, headers)
+                resp = conn.getresponse()
+            except policy.exceptions, exp:
+                conn.close()
+                if not policy.allows(method='POST',
+                                     attempts=attempts,
+                                     exc=exp,
+                                     idempotent=True):
+                    self.output.error(exp)
+                    return False
+            else:
+                if not policy.allows(method='POST',
+                                     attempts=attempts,
+                                     status=resp.status,
+                                     idempotent=True):
+                    break
+                resp.read()
+                conn.close()
+                exp = resp.status
 
-        try:
-            resp = conn.getresponse()
-        except httplib.BadStatusLine, exp:
-            self.output.error(exp)
-            return False
+            # Getting a token is safe to do again, try after a while
+            delay = policy.delay(attempts)
+            self.output.warn('Authentication failed with %r, attempt %s of %s'
+                             ' in %.2f seconds',
+                             exp, attempts + 1, policy.max_attempts, delay)
+            time.sleep(delay)
+            conn = self.connection._conn(self.m_args['url'])
 
+        self.m_args['nova_attempts'] = attempts
         # Set the status Codes
         self.m_args['nova_status'] = resp.status
         self.m_args['nova_reason'] = resp.reason
@@ -164,7 +238,7 @@ class Authentication(object):
             readresp = resp.read()
             conn.close()
             json_response = json.loads(readresp)
-            self.output.debug(readresp)
+            self.output.debug('%s', logger.Dump(readresp))
             self.parse_auth(json_response=json_response,
                             resp=resp)
             self.m_args['nova_resp'] = json_response
@@ -185,15 +259,22 @@ class Authentication(object):
             known_services = ['CLOUDSERVERSOPENSTACK',
                               'NOVA']
 
-            # loop through the Service Catalog
+            # loop through the Service Catalog, keeping every region so that
+            # other regions can be used without authenticating again
+            nova_endpoints = {}
             for service in json_response['access']['serviceCatalog']:
                 if service['name'].upper() in known_services:
                     for endpoint in service['endpoints']:
                         user_region = self.m_args['os_region'].upper()
                         cata_region = endpoint['region'].upper()
+                        r_cs = endpoint['publicURL']
+                        nova_endpoints[cata_region] = r_cs
                         if cata_region == user_region:
-                            r_cs = endpoint['publicURL']
                             self.m_args['nova_endpoint'] = r_cs
+            self.m_args['nova_endpoints'] = nova_endpoints
+            self.m_args['service_catalog'] = json_response['access'][
+                'serviceCatalog'
+            ]
 
             if not 'nova_endpoint' in self.m_args:
                 ep_d = json_response['access']['serviceCatalog']
@@ -212,6 +293,9 @@ class Authentication(object):
             tenant_id = json_response['access']['token']['tenant']['id']
             self.m_args['tenantid'] = tenant_id
             self.m_args['token'] = json_response['access']['token']['id']
+            self.m_args['expires'] = json_response['access']['token'].get(
+                'expires'
+            )
         except (Exception, UserWarning):
             self.output.error(traceback.format_exc())
 
@@ -225,4 +309,4 @@ class Authentication(object):
                         self.m_args['rackspace_auth'] = False
 
         if self.m_args['os_verbose']:
-            self.output.debug(json.dumps(json_response))
+            self.output.debug('%s', logger.Dump(json_response))
@@ -0,0 +1,121 @@
+# ==============================================================================
+# Copyright [2013] [Kevin Carter]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import zlib
+
+# Local Imports
+from bookofnova import personality
+
+
+# The encodings we ask the API for
+ACCEPT_ENCODING = 'gzip, deflate'
+
+# The zlib window bits of each encoding, gzip has a header and a trailer and
+# deflate is meant to be zlib wrapped
+WBITS = {'gzip': 16 + zlib.MAX_WBITS,
+         'deflate': zlib.MAX_WBITS}
+
+
+def encode(body, min_size=None, level=6):
+    """
+    Return "body", and the encoding used, gzipped if it is at least
+    "min_size" bytes. A body that is smaller, or None, is returned as it is
+    with an encoding of None. A streamed body is compressed a piece at a time.
+    The gzipped body is given as a "personality.Body", httplib sends those
+    after the headers instead of adding them to the headers, which fails
+    for binary data when a header is unicode.
+    """
+    if body is None or min_size is None or len(body) < min_size:
+        return body, None
+    compressor = zlib.compressobj(level, zlib.DEFLATED, WBITS['gzip'])
+    pieces = getattr(body, 'pieces', None) or [body]
+    data = [compressor.compress(piece) for piece in pieces]
+    data.append(compressor.flush())
+    return personality.Body(data), 'gzip'
+
+
+class Decoder(object):
+    def __init__(self, resp, chunk_size=65536):
+        """
+        Read the body of "resp", decompressing it as it is read if the API
+        sent it gzip or deflate encoded. "wire_bytes" are the bytes that came
+        over the network and "decoded_bytes" the bytes that were given back.
+        A body that is not encoded is read as it is.
+        """
+        self.resp = resp
+        self.chunk_size = chunk_size
+        encoding = (resp.getheader('content-encoding') or '').strip().lower()
+        if encoding in WBITS:
+            self.encoding = encoding
+            self._zlib = zlib.decompressobj(WBITS[encoding])
+        else:
+            self.encoding = None
+            self._zlib = None
+        self._started = False
+        self._buf = ''
+        self.wire_bytes = 0
+        self.decoded_bytes = 0
+
+    def _decompress(self, raw):
+        try:
+            data = self._zlib.decompress(raw)
+        except zlib.error:
+            if self.encoding != 'deflate' or self._started:
+                raise
+            # Some servers send deflate without the zlib wrapper
+            self._zlib = zlib.decompressobj(-zlib.MAX_WBITS)
+            data = self._zlib.decompress(raw)
+        self._started = True
+        return data
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = None
+        if self._zlib is None:
+            if size is None:
+                data = self.resp.read()
+            else:
+                data = self.resp.read(size)
+            self.wire_bytes += len(data)
+            self.decoded_bytes += len(data)
+            return data
+
+        pieces = [self._buf]
+        length = len(self._buf)
+        while size is None or length < size:
+            raw = self.resp.read(self.chunk_size)
+            if not raw:
+                if self._started:
+                    pieces.append(self._zlib.flush())
+                break
+            self.wire_bytes += len(raw)
+            data = self._decompress(raw)
+            pieces.append(data)
+            length += len(data)
+        data = ''.join(pieces)
+        if size is not None:
+            data, self._buf = data[:size], data[size:]
+        else:
+            self._buf = ''
+        self.decoded_bytes += len(data)
+        return data
+
+    def stats(self):
+        """
+        Return the encoding and the bytes on the wire and after decoding.
+        """
+        return {'encoding': self.encoding,
+                'wire': self.wire_bytes,
+                'decoded': self.decoded_bytes}
@@ -15,17 +15,58 @@
 # ==============================================================================
 import json
 import os
+import time
 import traceback
 import tempfile
+import threading
+import urllib
+import urlparse
 
 # Local Imports
-from bookofnova import connections, authentication, logger
+from bookofnova import connections, authentication, logger, personality
+from bookofnova import inventory, models, refcache, response, timeutils
+from bookofnova import workers as _workers
 
 
 class MissingValues(Exception):
     pass
 
 
+class RequestFailed(Exception):
+    def __init__(self, message, action=None):
+        """
+        The API gave us an error response, the "response.Response" of the
+        failed call is available as "action".
+        """
+        Exception.__init__(self, message)
+        self.action = action
+
+
+class BootBody(str):
+    """
+    The JSON boot body of a server. "server" is the name, flavor, image and
+    metadata the body was built with, in the shape the API gives a server,
+    so that they do not have to be parsed out of the body again.
+    """
+    server = None
+
+
+def _failed(action):
+    """
+    Return True if the API did not give us a good response for an action.
+    """
+    return not action['nova_status'] or action['nova_status'] >= 300
+
+
+def _field(item, name):
+    """
+    Return the value of the dotted field "name" from "item", IE "flavor.id".
+    """
+    for part in name.split('.'):
+        item = item[part]
+    return item
+
+
 class NovaCommands(object):
     def __init__(self, m_args, log_file=None, log_level='info', output=None):
         """
@@ -46,6 +87,24 @@ class NovaCommands(object):
         available. Functions available are dependant on your service catalog,
         provider and version of OpenStack.
 
+        Optional arguments that can also be set in "m_args" :
+          "pool_size" is the number of idle connections kept per host.
+          "pool_idle_timeout" is the seconds an idle connection is kept.
+          "token_cache" is a directory, or True, used to share tokens on disk.
+          "ref_cache_ttl" is the seconds flavors, images, key pairs and
+          networks are cached, either one number or a dictionary, IE
+          {'flavors': 3600, 'images': 300, 'keypairs': 300, 'networks': 300}.
+          "log_background" writes the log on a thread of its own.
+
+        Flavors, images, key pairs and networks can be looked up by ID or name
+        from the cache using "ref_cache", IE
+        "nova.ref_cache.get('flavors', '512MB Standard Instance')".
+
+        A local copy of the servers is kept in "inventory". Call
+        "nova.inventory.sync()" to load it, or bring it up to date, then ask it
+        questions, IE "nova.inventory.by_status('ERROR')". Servers that are
+        booted or deleted using this object are updated in it as they are.
+
         By Default the system will attempt to use the python standard logging
         module. The default behaviour is to log everything to stdout. If you
         provide a "log_file" the system will log to the file provided, if the
@@ -53,35 +112,372 @@ class NovaCommands(object):
         log level is "info" which can be overridden. If "output" is used the
         system will ignore the log level and simply use what is provided, which
         should be some form of logging system. This is useful when using your
-        own logging methods.
+        own logging methods. Messages are given to it with "%" style arguments,
+        IE "output.info('Destroying Server ID %s', server_id)", the same as the
+        python standard logging module.
         """
         self.m_args = m_args
         self.output = logger.load_in(log_file=log_file,
                                      log_level=log_level,
-                                     output=output)
+                                     output=output,
+                                     background=m_args.get('log_background'))
         if 'os_rax_auth' in self.m_args:
             if self.m_args['os_rax_auth']:
                 self.m_args['os_rax_auth'] = self.m_args['os_rax_auth'].upper()
         self.connection = connections.Connections(m_args=m_args,
                                                   output=self.output)
+        self.connection.re_auth = self.re_authenticate
+        self.ref_cache = refcache.ReferenceCache(
+            loaders={'flavors': self._loader('flavor_list_detail', 'flavors'),
+                     'images': self._loader('image_list_detail', 'images'),
+                     'keypairs': self._loader('key_pair_list', 'keypairs'),
+                     'networks': self._loader('list_quantum_networks',
+                                              'networks')},
+            ttls=self.m_args.get('ref_cache_ttl')
+        )
+        self.personality = personality.PersonalityCache(
+            limits=self.m_args.get('personality_limits')
+        )
+        self.inventory = inventory.Inventory(self)
+        self.region_lock = threading.Lock()
+        self.region_clients = {}
 
-    def auth(self):
+    def auth(self, stale_token=None):
         """
         Authenticate Against the NOVA API
         """
         self.output.info('Authenticating')
         auth = authentication.Authentication(m_args=self.m_args,
                                              output=self.output)
-        data = auth.os_auth()
+        data = auth.os_auth(stale_token=stale_token)
         self.m_args['token'] = data['token']
         return data
 
     def re_authenticate(self):
         """
-        Updates the users token
+        Updates the users token. This is called for you when the API rejects
+        the token that we have.
         """
         self.output.info('Re-Authenticating')
-        self.auth()
+        return self.auth(stale_token=self.m_args.get('token'))
+
+    def _loader(self, method, collection):
+        """
+        Return a callable that loads "collection" using the method named
+        "method" for the reference cache.
+        """
+        def _load():
+            action = getattr(self, method)()
+            if _failed(action):
+                raise RequestFailed('Failed to load the %s, status %s'
+                                    % (collection, action['nova_status']),
+                                    action=action)
+            return action['nova_resp'].get(collection) or []
+        return _load
+
+    def _args(self):
+        """
+        Return a copy of our arguments for a single call. The status and the
+        response of the call are written to the copy, which becomes the
+        "response.Response" of the call, so calls that run at the same time
+        never overwrite each other.
+        """
+        return dict(self.m_args)
+
+    def map(self, method, items, workers=10, ordered=True, **kwargs):
+        """
+        Run the method named "method" for every item in "items", IE :
+
+        results = nova.map('server_info', server_ids, workers=20)
+        for server_id, server in results:
+            print(server['nova_resp'])
+
+        The calls are made on a pool of "workers" threads. Results are given
+        back as "(item, result)" pairs in the order of "items", if "ordered"
+        is False they are given back as soon as they are done. If an item is a
+        tuple it is used as the arguments of the call, IE
+        "(server_id, False)" for "re_booter", and "kwargs" are given to every
+        call. A failed item will not stop the batch, once the results have
+        been read "results.errors" will have the exception, or the response if
+        the API returned an error, for every item that failed.
+        """
+        return _workers.BatchMap(func=getattr(self, method),
+                                 items=items,
+                                 pool=_workers.WorkerPool(workers=workers),
+                                 ordered=ordered,
+                                 failed=_failed,
+                                 shutdown=True,
+                                 **kwargs)
+
+    def region(self, region):
+        """
+        Return a NovaCommands for "region", IE "ORD", that uses the token and
+        service catalog we already have, so no new authentication is needed.
+        The regions that can be used are in "regions()". When the token of
+        the region is rejected we renew our own token and the region takes
+        it, authenticating with a copy of our arguments would point the
+        region back at our endpoint.
+        """
+        region = region.upper()
+        endpoints = self.m_args.get('nova_endpoints') or {}
+        if region not in endpoints:
+            raise MissingValues('There is no endpoint for the region "%s", the'
+                                ' regions are "%s"'
+                                % (region, sorted(endpoints)))
+        elif region == (self.m_args.get('os_region') or '').upper():
+            return self
+
+        with self.region_lock:
+            if region not in self.region_clients:
+                m_args = dict(self.m_args)
+                m_args['os_region'] = region
+                m_args['nova_endpoint'] = endpoints[region]
+                client = NovaCommands(m_args=m_args, output=self.output)
+                client.re_authenticate = self._region_auth(client, region)
+                client.connection.re_auth = client.re_authenticate
+                self.region_clients[region] = client
+            return self.region_clients[region]
+
+    def _region_auth(self, client, region):
+        """
+        Return the "re_authenticate" of the region client "client". It
+        renews our token, unless another call already has, and gives the
+        client the new token and the endpoint of "region".
+        """
+        def _re_authenticate():
+            self.connection._refresh_token(
+                stale_token=client.m_args.get('token')
+            )
+            endpoints = self.m_args.get('nova_endpoints') or {}
+            client.m_args['token'] = self.m_args.get('token')
+            client.m_args['nova_endpoints'] = endpoints
+            if region in endpoints:
+                client.m_args['nova_endpoint'] = endpoints[region]
+            return client.m_args
+        return _re_authenticate
+
+    def regions(self):
+        """
+        Return the regions that have a compute endpoint in our catalog.
+        """
+        return sorted(self.m_args.get('nova_endpoints') or {})
+
+    def fan_out(self, method, regions=None, collection=None, **kwargs):
+        """
+        Run the method named "method" in every region at the same time, IE :
+
+        servers, errors = nova.fan_out('server_list_detail',
+                                       collection='servers')
+
+        "regions" limits the regions used, by default it is all of them, and
+        "kwargs" are given to every call. If "collection" is given the items
+        of that collection from every region are put in one list and each
+        item has its "region" set, otherwise the results are a dictionary of
+        region to the response. "errors" is a dictionary of region to the
+        exception, or the response if the API returned an error.
+        """
+        if regions is None:
+            regions = self.regions()
+        clients = [(region.upper(), self.region(region)) for region in regions]
+        pool = _workers.WorkerPool(workers=len(clients) or 1)
+        try:
+            futures = [(region, pool.submit(getattr(client, method), **kwargs))
+                       for region, client in clients]
+            results = {}
+            errors = {}
+            for region, future in futures:
+                try:
+                    action = future.result()
+                except Exception, exp:
+                    errors[region] = exp
+                    continue
+                if (isinstance(action, (dict, response.Response)) and
+                        _failed(action)):
+                    errors[region] = action
+                else:
+                    results[region] = action
+        finally:
+            pool.shutdown(wait=False)
+
+        if collection is None:
+            return results, errors
+        items = []
+        for region, _ in clients:
+            if region in results:
+                for item in results[region]['nova_resp'].get(collection) or []:
+                    item['region'] = region
+                    items.append(item)
+        return items, errors
+
+    def _paginate(self, path, collection, page_size=None, params=None,
+                  marker_field='id', fields=None, stream=False, model=None):
+        """
+        Yield the items of "collection" one at a time, getting "path" a page
+        at a time. Each page is asked for with a "limit" of "page_size" and
+        the next page is found using the "next" link given by the API. If the
+        API did not give us a link and the page was full, the next page is
+        asked for using the last item as the "marker". "params" are added to
+        the query of every page and "marker_field" is the dotted name of the
+        field used as the marker.
+
+        If "stream" is True, or "fields" is given, each page is parsed as it
+        is read, see "connections.Connections._stream_action".
+
+        If "model" is given, IE "models.Server", each item is given as that
+        model. Models are always streamed, only the fields of the model are
+        parsed and its lazy sections are kept as JSON text until they are
+        used, a model built from a parsed item would hold as much as the
+        item.
+        """
+        if model is not None:
+            stream = True
+            fields = model.projection(marker_field)
+        elif fields is not None:
+            stream = True
+            fields = list(fields)
+            if marker_field not in fields:
+                fields.append(marker_field)
+        query = dict(params or {})
+        if page_size:
+            query['limit'] = page_size
+
+        first_marker = None
+        while True:
+            if query:
+                page_path = '%s?%s' % (path, urllib.urlencode(query))
+            else:
+                page_path = path
+            if stream:
+                action = self._args()
+                items = self.connection._stream_action(path=page_path,
+                                                       args=action,
+                                                       collection=collection,
+                                                       fields=fields)
+            else:
+                action = self.connection._get_action(path=page_path,
+                                                     args=self._args())
+                items = []
+                if not _failed(action):
+                    items = action['nova_resp'].get(collection) or []
+
+            count = 0
+            marker = None
+            for item in items:
+                marker = _field(item, marker_field)
+                if count == 0:
+                    if marker == first_marker:
+                        # The API is ignoring the marker, we would never finish
+                        return
+                    first_marker = marker
+                count += 1
+                if model is not None:
+                    item = model.from_dict(item)
+                yield item
+
+            if _failed(action):
+                raise RequestFailed('Failed to get "%s", status %s'
+                                    % (page_path, action['nova_status']),
+                                    action=action)
+            elif not count:
+                break
+
+            next_query = None
+            for link in action['nova_resp'].get('%s_links' % collection, []):
+                if link.get('rel') == 'next':
+                    next_query = urlparse.parse_qs(
+                        urlparse.urlparse(link['href']).query
+                    )
+            if next_query:
+                query.update((key, value[-1]) for key, value
+                             in next_query.items())
+            elif page_size and count == page_size:
+                query['marker'] = marker
+            else:
+                break
+
+    def iter_servers_detail(self, page_size=None, fields=None, stream=False,
+                            model=False, **params):
+        """
+        Yield the detailed information for every server in the REGION you
+        specified when you authenticated, one server at a time. The servers
+        are requested "page_size" at a time. Any other keyword arguments are
+        used as filters, IE "status='ACTIVE'" or "changes-since" given as
+        "**{'changes-since': timestamp}".
+
+        If "stream" is True the servers are parsed as the response is read.
+        Giving "fields", IE ['id', 'status', 'flavor.id', 'addresses'], also
+        streams the response and only those fields of each server are parsed.
+
+        If "model" is True each server is given as a "models.Server", which
+        takes far less memory than the dictionary when many servers are kept.
+        Models are always streamed and "fields" are not used for them.
+        """
+        self.output.info('Providing a Detailed List of Servers by page')
+        items = self._paginate(path='/servers/detail',
+                               collection='servers',
+                               page_size=page_size,
+                               params=params,
+                               fields=fields,
+                               stream=stream,
+                               model=models.Server if model else None)
+        for item in items:
+            yield item
+
+    def iter_images_detail(self, page_size=None, fields=None, stream=False,
+                           model=False, **params):
+        """
+        Yield the detailed information for every image available to you, one
+        image at a time. The images are requested "page_size" at a time. Any
+        other keyword arguments are used as filters. See "iter_servers_detail"
+        for "fields", "stream" and "model", images are given as
+        "models.Image".
+        """
+        self.output.info('Providing a Detailed List of Images by page')
+        items = self._paginate(path='/images/detail',
+                               collection='images',
+                               page_size=page_size,
+                               params=params,
+                               fields=fields,
+                               stream=stream,
+                               model=models.Image if model else None)
+        for item in items:
+            yield item
+
+    def iter_flavors_detail(self, page_size=None, fields=None, stream=False,
+                            model=False, **params):
+        """
+        Yield the detailed information for every flavor available to you, one
+        flavor at a time. The flavors are requested "page_size" at a time. Any
+        other keyword arguments are used as filters. See "iter_servers_detail"
+        for "fields", "stream" and "model", flavors are given as
+        "models.Flavor".
+        """
+        self.output.info('Providing a Detailed List of Flavors by page')
+        items = self._paginate(path='/flavors/detail',
+                               collection='flavors',
+                               page_size=page_size,
+                               params=params,
+                               fields=fields,
+                               stream=stream,
+                               model=models.Flavor if model else None)
+        for item in items:
+            yield item
+
+    def iter_key_pairs(self, page_size=None, stream=False, model=False):
+        """
+        Yield every key pair, one at a time. Key pairs are requested
+        "page_size" at a time when the API supports paging them. If "model"
+        is True each key pair is given as a "models.KeyPair".
+        """
+        self.output.info('Providing a Key Pair List by page')
+        items = self._paginate(path='/os-keypairs',
+                               collection='keypairs',
+                               page_size=page_size,
+                               marker_field='keypair.name',
+                               stream=stream,
+                               model=models.KeyPair if model else None)
+        for item in items:
+            yield item
 
     def key_pair(self, key_name=None, key_path=tempfile.gettempdir()):
         """
@@ -93,21 +489,20 @@ class NovaCommands(object):
         b_d = {"keypair": {"name": key_name}}
         pay_load = json.dumps(b_d)
         action = self.connection._post_action(path=path,
-                                              args=self.m_args,
+                                              args=self._args(),
                                               body=pay_load)
+        self.ref_cache.invalidate('keypairs')
         key_data = action['nova_resp']
         try:
             if 'keypair' in key_data:
-                self.output.info('Key file has been Placed in "%s"' % key_loc)
+                self.output.info('Key file has been Placed in "%s"', key_loc)
                 with open(key_loc, 'w+') as key_f:
                     key_f.write(key_data['keypair']['private_key'])
                     os.chmod(key_loc, 0400)
-            return self.m_args
+            return action
         except Exception:
             self.output.error(traceback.format_exc())
-            self.m_args['nova_status'] = False
-            return self.m_args
-        return self.m_args
+            return action.replace(status=False)
 
     def key_pair_destroy(self, key_name, key_loc=None):
         """
@@ -119,12 +514,12 @@ class NovaCommands(object):
         """
         self.output.info('Destroying our Key File')
         path = '/os-keypairs/%s' % key_name
-        action = self.connection._delete_action(path=path, args=self.m_args)
-        self.m_args = action
+        action = self.connection._delete_action(path=path, args=self._args())
+        self.ref_cache.invalidate('keypairs')
         if key_loc:
             if os.path.isfile(key_loc):
                 os.remove(key_loc)
-        return self.m_args
+        return action
 
     def key_pair_list(self):
         """
@@ -132,9 +527,8 @@ class NovaCommands(object):
         """
         self.output.info('Providing a Key Pair List')
         path = '/os-keypairs'
-        action = self.connection._get_action(path=path, args=self.m_args)
-        self.m_args = action
-        return self.m_args
+        action = self.connection._get_action(path=path, args=self._args())
+        return action
 
     def list_quantum_networks(self):
         """
@@ -142,9 +536,8 @@ class NovaCommands(object):
         """
         self.output.info('Checking to see if the network you specified Exists')
         path = '/os-networksv2'
-        action = self.connection._get_action(path=path, args=self.m_args)
-        self.m_args = action
-        return self.m_args
+        action = self.connection._get_action(path=path, args=self._args())
+        return action
 
     def builder(self, pay_load):
         """
@@ -164,7 +557,10 @@ class NovaCommands(object):
                     "inj_file": [{dst: src}, {dst: src}],
                     "key_name": "lynux",
                     "manual_disk": True,
-                    "meta": [{key: value}, {key: value}]}
+                    "meta": [{key: value}, {key: value}],
+                    "min_count": 200,
+                    "max_count": 200,
+                    "return_reservation_id": True}
 
         Additional Options :
 
@@ -178,7 +574,12 @@ class NovaCommands(object):
         is a "True" or "False" Value. 
 
         "inj_file" allows for a file to be base64 encoded and injected on boot.
-        this is a destination_on_new_instances=source_location variable.
+        this is a destination_on_new_instances=source_location variable. The
+        number of files, the length of the destination and the size of each
+        file are checked against "m_args['personality_limits']", or the Nova
+        defaults, and "personality.LimitExceeded" is raised if they are over.
+        When files are injected the body is a "personality.Body" which streams
+        the encoded files into the request, "str()" gives the whole body.
 
         "key_name" allows for a SSH key to be injected on boot, This is an
         OPENSTACK only feature, IE NOT RAX Public Cloud.
@@ -189,9 +590,109 @@ class NovaCommands(object):
         "meta" is a used for metadata on an instance. To set metadata you will
         need to create a list of dictionaries where the "key" is the metadata
         key and the "value" is the metadata value.
+
+        "min_count" and "max_count" boot a group of identical servers with one
+        request. The API builds "max_count" servers if it can and fails if it
+        can not build at least "min_count". If "return_reservation_id" is True
+        the API gives back the reservation ID of the group instead of the
+        first server, use "reservation_servers" to find the servers in it.
+        """
+        self.output.debug('Building Boot Configuration, pay load == %s',
+                          logger.Dump(pay_load))
+        find_key = lambda name: self.ref_cache.by_name('keypairs', name)
+        find_network = lambda uuid: self.ref_cache.by_id('networks', uuid)
+        build_body = self._compile(pay_load=pay_load,
+                                   find_key=find_key,
+                                   find_network=find_network,
+                                   fragments={})
+        if self.m_args['os_verbose']:
+            self.output.debug('BUILD JSON DUMP\t:%s', logger.Dump(build_body))
+        return build_body
+
+    def build_many(self, payloads):
+        """
+        Build the boot body for many servers at once. Each of the "payloads"
+        is the same as the "pay_load" given to "builder". The key pairs and
+        networks are looked up once for the whole batch, pieces of the body
+        that are the same between servers are only encoded once.
+
+        Returns "(bodies, errors)". "bodies" is a list in the same order as
+        "payloads" with the body for each server, or None if the payload was
+        not valid. "errors" is a dictionary of the index of each payload that
+        was not valid to a list of the reasons why. Unlike "builder" a key pair
+        or network that does not exist is an error.
+        """
+        self.output.info('Building Boot Configuration for %s servers',
+                         len(payloads))
+        snapshots = {}
+        for resource, field in (('keypairs', 'key_name'),
+                                ('networks', 'network_uuid')):
+            if any(pay_load.get(field) for pay_load in payloads):
+                try:
+                    snapshots[resource] = self.ref_cache.snapshot(resource)
+                except RequestFailed, exp:
+                    snapshots[resource] = exp
+
+        def _find(resource, index):
+            def _lookup(key):
+                snapshot = snapshots[resource]
+                if isinstance(snapshot, RequestFailed):
+                    raise MissingValues(str(snapshot))
+                return getattr(snapshot, index).get(key)
+            return _lookup
+
+        find_key = _find('keypairs', 'by_name')
+        find_network = _find('networks', 'by_id')
+        fragments = {}
+        bodies = []
+        errors = {}
+        for index, pay_load in enumerate(payloads):
+            problems = []
+            try:
+                body = self._compile(pay_load=pay_load,
+                                     find_key=find_key,
+                                     find_network=find_network,
+                                     fragments=fragments,
+                                     errors=problems)
+            except (MissingValues, personality.LimitExceeded,
+                    ValueError, TypeError), exp:
+                problems.append(str(exp))
+            if problems:
+                errors[index] = problems
+                body = None
+            bodies.append(body)
+        return bodies, errors
+
+    def _fragment(self, fragments, key, value):
+        """
+        Return "value" encoded as JSON. The encoded value is kept in
+        "fragments" under "key" so that it is only encoded once.
+        """
+        if key not in fragments:
+            fragments[key] = json.dumps(value)
+        return fragments[key]
+
+    def _pairs(self, pay_load, field):
+        """
+        Make sure that "pay_load[field]" is a list of "key=value" strings,
+        IE the "meta" and "inj_file" of a server.
+        """
+        for pair in pay_load[field]:
+            if not isinstance(pair, basestring) or '=' not in pair:
+                raise MissingValues('"%s" has to be a list of "key=value"'
+                                    ' strings, "%s" is not' % (field, pair))
+
+    def _compile(self, pay_load, find_key, find_network, fragments,
+                 errors=None):
+        """
+        Return the JSON boot body for "pay_load". "find_key" and
+        "find_network" are used to look up key pairs and networks and
+        "fragments" holds the pieces of JSON that can be shared between
+        servers. If "errors" is a list then a key pair, network or file that
+        was not found is added to it, otherwise it is left out of the body.
+        When files are injected a "personality.Body" is returned instead of a
+        "BootBody", either has the fields of the server as "server".
         """
-        self.output.debug('Building Boot Configuration, pay load == %s'
-                          % pay_load)
         if not 'name' in pay_load:
             raise MissingValues('No Name given when attempting to boot')
         elif not 'imageRef' in pay_load:
@@ -200,98 +701,169 @@ class NovaCommands(object):
         elif not 'flavorRef' in pay_load:
             raise MissingValues('No Flavor Reference given when attempting'
                                 ' to boot')
-        body = {"server": {"name": pay_load['name'],
-                           "imageRef": pay_load['imageRef'],
-                           "flavorRef": pay_load['flavorRef']}}
+        body = [('name', json.dumps(pay_load['name'])),
+                ('imageRef', self._fragment(fragments,
+                                            ('imageRef', pay_load['imageRef']),
+                                            pay_load['imageRef'])),
+                ('flavorRef', self._fragment(fragments,
+                                             ('flavorRef',
+                                              pay_load['flavorRef']),
+                                             pay_load['flavorRef']))]
+        networks = []
+        use_networks = False
 
         # if a Rackspace Cloud Server add the default Networks
         if ('rackspace_auth' in self.m_args and
             self.m_args['rackspace_auth']):
+            use_networks = True
             rax_pri = '11111111-1111-1111-1111-111111111111'
-            prinet = {'uuid': rax_pri}
             rax_pub = '00000000-0000-0000-0000-000000000000'
-            pubnet = {'uuid': rax_pub}
 
-            networks = body['server']['networks'] = []
             # Allows the user to opt-out of a network
             if 'rax_pub' in pay_load or 'rax_pri' in pay_load:
-                if pay_load['rax_pub']:
-                    networks.append(pubnet)
-                if pay_load['rax_pri']:
-                    networks.append(prinet)
+                if pay_load.get('rax_pub'):
+                    networks.append(rax_pub)
+                if pay_load.get('rax_pri'):
+                    networks.append(rax_pri)
             else:
-                for net in prinet, pubnet:
-                    networks.append(net)
+                networks.extend([rax_pri, rax_pub])
 
         # If quantum is used, and specified, use it.
         if 'network_uuid' in pay_load:
             if pay_load['network_uuid']:
-                quantum_networks = self.list_quantum_networks()['nova_resp']
-                if quantum_networks:
-                    if not networks:
-                        networks = body['server']['networks'] = []
-                    for net in quantum_networks['networks']:
-                        for net_uuid in pay_load['network_uuid']:
-                            if net == net_uuid:
-                                networks.append({'uuid': net})
-
-        # Inject Files, This is generally limited to 5 injected files.
+                use_networks = True
+                for net_uuid in pay_load['network_uuid']:
+                    if find_network(net_uuid):
+                        networks.append(net_uuid)
+                    elif errors is not None:
+                        errors.append('The network "%s" was not found'
+                                      % net_uuid)
+
+        if use_networks:
+            key = ('networks', tuple(networks))
+            value = [{'uuid': net_uuid} for net_uuid in networks]
+            body.append(('networks', self._fragment(fragments, key, value)))
+
+        # Inject Files, This is generally limited to 5 injected files. The
+        # encoded files are cached and sent as they are, not copied into the
+        # body.
         if 'inj_file' in pay_load:
             if pay_load['inj_file']:
-                personality = body['server']['personality'] = []
-                for i_f in pay_load['inj_file']:
-                    dst, src = i_f.split('=', 1)
-                    loc_src = os.path.realpath(src)
-                    if os.path.isfile(loc_src):
-                        try:
-                            with open(loc_src) as enc_src:
-                                e_s = enc_src.read()
-                            _encode = e_s.encode('base64')
-                            inj_construct = {'path': dst.encode('utf-8'),
-                                             'contents': _encode}
-                            personality.append(inj_construct)
-                        except Exception:
-                            self.output.critical(traceback.format_exc())
+                self._pairs(pay_load, 'inj_file')
+                try:
+                    pieces = self.personality.pieces(pay_load['inj_file'],
+                                                     errors=errors)
+                except (IOError, OSError):
+                    self.output.critical(traceback.format_exc())
+                else:
+                    body.append(('personality', pieces))
 
         # Use an SSH key on boot for an instance
         if 'key_name' in pay_load:
             if pay_load['key_name']:
-                keys = self.key_pair_list()['nova_resp']
-                for key in keys['keypairs']:
-                    if pay_load['key_name'] == key['keypair']['name']:
-                        os_key = {"key_name": pay_load['key_name']}
-                        body['server'].update(os_key)
+                if find_key(pay_load['key_name']):
+                    body.append(('key_name',
+                                 self._fragment(fragments,
+                                                ('key_name',
+                                                 pay_load['key_name']),
+                                                pay_load['key_name'])))
+                elif errors is not None:
+                    errors.append('The key pair "%s" was not found'
+                                  % pay_load['key_name'])
 
         # Use meta data if specified
+        meta_dict = {}
         if 'meta' in pay_load:
             if pay_load['meta']:
-                meta_dict = {}
+                self._pairs(pay_load, 'meta')
                 for m_f in pay_load['meta']:
                     key, value = m_f.split('=', 1)
                     meta_dict.update({key: value})
-                body['server']['metadata'] = meta_dict
+                body.append(('metadata',
+                             self._fragment(fragments,
+                                            ('metadata',
+                                             tuple(pay_load['meta'])),
+                                            meta_dict)))
 
         # Set a Manual Disk if specified
         if 'manual_disk' in pay_load:
             if pay_load['manual_disk']:
-                os_manaul_disk = {'diskConfig': 'MANUAL'}
-                body['server'].update(os_manaul_disk)
+                body.append(('diskConfig', '"MANUAL"'))
 
-        build_body = json.dumps(body)
-        if self.m_args['os_verbose']:
-            self.output.debug('BUILD JSON DUMP\t:%s' % build_body)
+        # Boot a group of identical servers with one request
+        if 'min_count' in pay_load or 'max_count' in pay_load:
+            min_count = pay_load.get('min_count')
+            max_count = pay_load.get('max_count')
+            try:
+                if min_count is None:
+                    min_count = 1
+                min_count = int(min_count)
+                if max_count is None:
+                    max_count = min_count
+                max_count = int(max_count)
+            except (ValueError, TypeError):
+                raise MissingValues('"min_count" and "max_count" have to be'
+                                    ' whole numbers, not %r and %r'
+                                    % (pay_load.get('min_count'),
+                                       pay_load.get('max_count')))
+            if min_count < 1 or max_count < min_count:
+                raise MissingValues('"min_count" has to be at least 1 and no'
+                                    ' more than "max_count", not %s and %s'
+                                    % (min_count, max_count))
+            body.append(('min_count', json.dumps(min_count)))
+            body.append(('max_count', json.dumps(max_count)))
+        if pay_load.get('return_reservation_id'):
+            body.append(('return_reservation_id', 'true'))
+
+        pieces = ['{"server": {']
+        for key, value in body:
+            if len(pieces) > 1:
+                pieces.append(', ')
+            pieces.append('"%s": ' % key)
+            if isinstance(value, list):
+                pieces.extend(value)
+            else:
+                pieces.append(value)
+        pieces.append('}}')
+        server = {'name': pay_load['name'],
+                  'flavor': {'id': pay_load['flavorRef']},
+                  'image': {'id': pay_load['imageRef']},
+                  'metadata': meta_dict}
+        if 'personality' in dict(body):
+            return personality.Body(pieces, server=server)
+        build_body = BootBody(''.join(pieces))
+        build_body.server = server
         return build_body
 
     def booter(self, payload):
         """
         This method requires that you provide it a "name" for the server.
+
+        If the body was built with "return_reservation_id" the response is
+        the reservation ID of the servers, IE
+        "action['nova_resp']['reservation_id']".
         """
         path = '/servers'
         action = self.connection._post_action(path=path,
-                                              args=self.m_args,
+                                              args=self._args(),
                                               body=payload)
-        self.m_args = action
-        return self.m_args
+        if not _failed(action):
+            self.inventory.booted(action=action,
+                                  server=getattr(payload, 'server', None))
+        return action
+
+    def reservation_servers(self, reservation_id, page_size=None,
+                            model=False):
+        """
+        Return the detailed information of every server that was booted by
+        one multiple server request, found using one list of servers filtered
+        by "reservation_id". The servers can then be given to "wait_for".
+        """
+        self.output.info('Finding the Servers of Reservation "%s"',
+                         reservation_id)
+        return list(self.iter_servers_detail(page_size=page_size,
+                                             model=model,
+                                             reservation_id=reservation_id))
 
     def confirm_revert_resize(self, server_id, confirm=True):
         """
@@ -305,7 +877,7 @@ class NovaCommands(object):
         "server_id".
         """
         self.output.info('Performing confirmation on resize for %s,'
-                         ' Confirm == %s' % (server_id, confirm))
+                         ' Confirm == %s', server_id, confirm)
         if confirm:
             payload = {"confirmResize": None}
         else:
@@ -314,34 +886,32 @@ class NovaCommands(object):
         pay_load = json.dumps(payload)
         path = '/servers/%s/action' % server_id
         action = self.connection._post_action(path=path,
-                                              args=self.m_args,
+                                              args=self._args(),
                                               body=pay_load)
-        self.m_args = action
-        return self.m_args
+        return action
 
     def re_sizer(self, server_id, flavor):
         """
         You can resize a server using this method. The method allows for an
         instance to be resized with to any available size. Any flavor that you
         pass the instance will be looked up prior to the action being attempted.
+        The "flavor" can be the ID or the name of the flavor.
 
         In order to resize a server you will need to have the "server_id" as
         well as the "flavor" size that you want to use.
         """
-        self.output.info('Performing a resize on %s, New size == %s'
-                         % (server_id, flavor))
-        flavors = self.flavor_list()
-        for flv in flavors['nova_resp']['flavors']:
-            if flv['id'] == flavor:
-                flavor_link = flv['id']
-        pay_load = json.dumps({"resize": {"flavorRef": flavor_link}})
+        self.output.info('Performing a resize on %s, New size == %s',
+                         server_id, flavor)
+        flv = self.ref_cache.get('flavors', flavor)
+        if not flv:
+            raise MissingValues('The flavor "%s" was not found' % flavor)
+        pay_load = json.dumps({"resize": {"flavorRef": flv['id']}})
 
         path = '/servers/%s/action' % server_id
         action = self.connection._post_action(path=path,
-                                              args=self.m_args,
+                                              args=self._args(),
                                               body=pay_load)
-        self.m_args = action
-        return self.m_args
+        return action
 
     def re_booter(self, server_id, hard_reboot=True):
         """
@@ -353,8 +923,8 @@ class NovaCommands(object):
         This requires that the user, YOU, to provide a server UUID as
         "server_id".
         """
-        self.output.info('Performing a reboot on %s, Hard Reboot == %s'
-                         % (server_id, hard_reboot))
+        self.output.info('Performing a reboot on %s, Hard Reboot == %s',
+                         server_id, hard_reboot)
         if hard_reboot:
             payload = {"reboot": {"type": 'HARD'}}
         else:
@@ -363,10 +933,9 @@ class NovaCommands(object):
         pay_load = json.dumps(payload)
         path = '/servers/%s/action' % server_id
         action = self.connection._post_action(path=path,
-                                              args=self.m_args,
+                                              args=self._args(),
                                               body=pay_load)
-        self.m_args = action
-        return self.m_args
+        return action
 
     def server_list(self):
         """
@@ -375,9 +944,8 @@ class NovaCommands(object):
         """
         self.output.info('Providing a list of Servers')
         path = '/servers'
-        action = self.connection._get_action(path=path, args=self.m_args)
-        self.m_args = action
-        return self.m_args
+        action = self.connection._get_action(path=path, args=self._args())
+        return action
 
     def server_list_detail(self):
         """
@@ -386,9 +954,8 @@ class NovaCommands(object):
         """
         self.output.info('Providing a Detailed List of Servers')
         path = '/servers/detail'
-        action = self.connection._get_action(path=path, args=self.m_args)
-        self.m_args = action
-        return self.m_args
+        action = self.connection._get_action(path=path, args=self._args())
+        return action
 
     def server_info(self, server_id):
         """
@@ -398,12 +965,133 @@ class NovaCommands(object):
         This requires that the user, YOU, to provide a server UUID as
         "server_id".
         """
-        self.output.info('Providing Server Information on Instance ID %s'
-                         % server_id)
+        self.output.info('Providing Server Information on Instance ID %s',
+                         server_id)
         path = '/servers/%s' % server_id
-        action = self.connection._get_action(path=path, args=self.m_args)
-        self.m_args = action
-        return self.m_args
+        action = self.connection._get_action(path=path, args=self._args())
+        return action
+
+    def wait_for(self, server_ids, target_status='ACTIVE', timeout=1800,
+                 interval=5, max_interval=60, page_size=None,
+                 fail_statuses=('ERROR',)):
+        """
+        Wait for many servers at once and yield each server as it reaches
+        "target_status", IE "ACTIVE" after a build or "VERIFY_RESIZE" after a
+        resize, or fails with one of "fail_statuses". A server that is deleted
+        is yielded with the status "DELETED".
+
+        Every "interval" seconds one detailed list of servers is asked for,
+        using "changes-since" so that only the servers that changed come back,
+        no matter how many servers we are waiting on. When nothing we are
+        waiting on changes the interval grows, up to "max_interval". Any
+        servers that have not been yielded after "timeout" seconds are given
+        up on.
+        """
+        pending = set(server_ids)
+        statuses = {}
+        finished = ((target_status.upper(), 'DELETED') +
+                    tuple(status.upper() for status in fail_statuses))
+        give_up = time.time() + timeout
+        delay = interval
+        since = None
+        while pending:
+            params = {}
+            if since is not None:
+                params['changes-since'] = timeutils.iso8601(since)
+            changed = False
+            seen = set()
+            servers = self.iter_servers_detail(page_size=page_size, **params)
+            for server in servers:
+                seen.add(server['id'])
+                updated = timeutils.parse_iso8601(server.get('updated'))
+                if updated is not None:
+                    # Allow for changes made while the list was being built
+                    since = max(since, updated - interval)
+                if server['id'] in pending:
+                    status = server.get('status', '').upper()
+                    if statuses.get(server['id']) != status:
+                        statuses[server['id']] = status
+                        changed = True
+                    if status in finished:
+                        pending.discard(server['id'])
+                        yield server
+
+            if not params:
+                # A full list, any server that is not in it is gone
+                for server_id in pending - seen:
+                    pending.discard(server_id)
+                    yield {'id': server_id, 'status': 'DELETED'}
+                if since is None:
+                    since = time.time() - interval
+
+            remaining = give_up - time.time()
+            if not pending:
+                break
+            elif remaining <= 0:
+                self.output.warn('Gave up waiting for %s servers to be %s',
+                                 len(pending), target_status)
+                break
+            elif changed:
+                delay = interval
+            else:
+                delay = min(delay * 2, max_interval)
+            time.sleep(min(delay, remaining))
+
+    def nuke_many(self, server_ids, concurrency=10, wait=True, timeout=600,
+                  interval=5, max_interval=60, page_size=None):
+        """
+        Delete many servers at once, IE to tear down a test environment :
+
+        summary = nova.nuke_many(server_ids, concurrency=50)
+
+        The deletes are made on a pool of "concurrency" threads. A server that
+        the API does not know, a 404, is already gone. If "wait" is True we
+        then wait up to "timeout" seconds for the servers to go away using
+        "wait_for", which asks for one list of servers each interval however
+        many servers we are waiting on. A server in "ERROR" is waited on as
+        well, deleting it may still work.
+
+        Returns a dictionary of the "deleted" server IDs, the "failed" server
+        IDs with the exception, or the response, of their delete, and the
+        "timed_out" server IDs that were still there when we gave up. Without
+        "wait" a server is "deleted" once the API has accepted its delete.
+        """
+        server_ids = set(server_ids)
+        summary = {'deleted': [], 'failed': {}, 'timed_out': []}
+        self.output.info('Destroying %s Servers', len(server_ids))
+        batch = self.map('server_nuker',
+                         server_ids,
+                         workers=concurrency,
+                         ordered=False)
+        accepted = [server_id for server_id, _ in batch]
+        for server_id, error in batch.errors.items():
+            if (isinstance(error, response.Response) and
+                    error.status == 404):
+                summary['deleted'].append(server_id)
+            else:
+                summary['failed'][server_id] = error
+        if not wait:
+            summary['deleted'].extend(accepted)
+            return summary
+
+        gone = set()
+        servers = self.wait_for(accepted,
+                                target_status='DELETED',
+                                timeout=timeout,
+                                interval=interval,
+                                max_interval=max_interval,
+                                page_size=page_size,
+                                fail_statuses=())
+        for server in servers:
+            gone.add(server['id'])
+            self.inventory.deleted(server_id=server['id'])
+        summary['deleted'].extend(gone)
+        summary['timed_out'] = [server_id for server_id in accepted
+                                if server_id not in gone]
+        self.output.info('Destroyed %s Servers, %s failed, %s timed out',
+                         len(summary['deleted']), len(summary['failed']),
+                         len(summary['timed_out']))
+        return summary
 
     def image_list(self):
         """
@@ -414,9 +1102,8 @@ class NovaCommands(object):
         """
         self.output.info('Providing an Image List')
         path = '/images'
-        action = self.connection._get_action(path=path, args=self.m_args)
-        self.m_args = action
-        return self.m_args
+        action = self.connection._get_action(path=path, args=self._args())
+        return action
 
     def image_list_detail(self):
         """
@@ -426,9 +1113,8 @@ class NovaCommands(object):
         """
         self.output.info('Providing an Image List')
         path = '/images/detail'
-        action = self.connection._get_action(path=path, args=self.m_args)
-        self.m_args = action
-        return self.m_args
+        action = self.connection._get_action(path=path, args=self._args())
+        return action
 
     def image_create(self, server_id, img_name, meta_data=None):
         """
@@ -436,8 +1122,8 @@ class NovaCommands(object):
         the Image you wish to create. Optionally you can add meta data to the
         image as well.
         """
-        self.output.info('Creating an Image of Server ID %s => Image Name %s'
-                         % (server_id, img_name))
+        self.output.info('Creating an Image of Server ID %s => Image Name %s',
+                         server_id, img_name)
         path = '/servers/%s/action' % server_id
         if meta_data:
             _pl = {"createImage": {"name": img_name, "metadata": meta_data}}
@@ -445,10 +1131,10 @@ class NovaCommands(object):
             _pl = {"createImage": {"name": img_name}}
         pay_load = json.dumps(_pl)
         action = self.connection._post_action(path=path,
-                                              args=self.m_args,
+                                              args=self._args(),
                                               body=pay_load)
-        self.m_args = action
-        return self.m_args
+        self.ref_cache.invalidate('images')
+        return action
 
     def image_info(self, image_id):
         """
@@ -458,12 +1144,11 @@ class NovaCommands(object):
         This requires that the user, YOU, to provide a image UUID as
         "image_id".
         """
-        self.output.info('Providing Information on image ID %s'
-                         % image_id)
+        self.output.info('Providing Information on image ID %s',
+                         image_id)
         path = '/images/%s' % image_id
-        action = self.connection._get_action(path=path, args=self.m_args)
-        self.m_args = action
-        return self.m_args
+        action = self.connection._get_action(path=path, args=self._args())
+        return action
 
     def image_nuker(self, image_id):
         """
@@ -472,11 +1157,11 @@ class NovaCommands(object):
         This requires that the user, YOU, to provide a server UUID as
         "image_id".
         """
-        self.output.info('Destroying Image ID "%s"' % image_id)
+        self.output.info('Destroying Image ID "%s"', image_id)
         path = '/images/%s' % image_id
-        action = self.connection._delete_action(path=path, args=self.m_args)
-        self.m_args = action
-        return self.m_args
+        action = self.connection._delete_action(path=path, args=self._args())
+        self.ref_cache.invalidate('images')
+        return action
 
     def flavor_list_detail(self):
         """
@@ -487,9 +1172,8 @@ class NovaCommands(object):
         """
         self.output.info('Providing a Detailed Flavor List')
         path = '/flavors/detail'
-        action = self.connection._get_action(path=path, args=self.m_args)
-        self.m_args = action
-        return self.m_args
+        action = self.connection._get_action(path=path, args=self._args())
+        return action
 
     def flavor_list(self):
         """
@@ -500,9 +1184,8 @@ class NovaCommands(object):
         """
         self.output.info('Providing a list of Flavors')
         path = '/flavors'
-        action = self.connection._get_action(path=path, args=self.m_args)
-        self.m_args = action
-        return self.m_args
+        action = self.connection._get_action(path=path, args=self._args())
+        return action
 
     def server_nuker(self, server_id):
         """
@@ -511,8 +1194,9 @@ class NovaCommands(object):
         This requires that the user, YOU, to provide a server UUID as
         "server_id".
         """
-        self.output.info('Destroying Server ID "%s"' % server_id)
+        self.output.info('Destroying Server ID "%s"', server_id)
         path = '/servers/%s' % server_id
-        action = self.connection._delete_action(path=path, args=self.m_args)
-        self.m_args = action
-        return self.m_args
+        action = self.connection._delete_action(path=path, args=self._args())
+        if not _failed(action) or action['nova_status'] == 404:
+            self.inventory.deleted(server_id=server_id)
+        return action
@@ -13,20 +13,195 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ==============================================================================
+import errno
 import httplib
 import json
+import socket
+import threading
+import time
+import traceback
 
-from bookofnova import statuscodes
+from bookofnova import compression, httpcache, jsonstream, personality
+from bookofnova import logger, ratelimit, response, retry, statuscodes
+from bookofnova import tracing
+
+
+def _body(body):
+    """
+    Return the body to send with a request. A streamed body is copied so that
+    it is read from the start every time it is sent.
+    """
+    if isinstance(body, personality.Body):
+        return body.copy()
+    return body
+
+
+def _stale(exp, writing):
+    """
+    Return True if "exp" shows that a reused connection had been closed by
+    the server before it got our request, so that sending the request again
+    can not do it twice. That is the connection being reset, or the pipe
+    broken, while the request is written, or the connection closing without
+    a status line. A timeout, or a reset once the request was sent, may come
+    after the server did the request.
+    """
+    if writing:
+        return (isinstance(exp, socket.error) and
+                exp.errno in (errno.EPIPE, errno.ECONNRESET))
+    elif isinstance(exp, httplib.BadStatusLine):
+        line = str(exp.line).strip("'")
+        return not line or line.startswith('No status line received')
+    return False
+
+
+class ConnectionPool(object):
+    def __init__(self, pool_size=10, idle_timeout=60):
+        """
+        Keep persistent HTTP/1.1 connections to the OpenStack API. Idle
+        connections are stored per host, "pool_size" is the most idle
+        connections that will be kept for any one host and "idle_timeout" is
+        the number of seconds a connection may sit idle before it is evicted.
+        The "hits", "misses", "reconnects" and "evictions" counters can be
+        used to confirm that connections are being reused.
+        """
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.hits = 0
+        self.misses = 0
+        self.reconnects = 0
+        self.evictions = 0
+
+    def _evict(self, conns, now):
+        """
+        Close every connection that has been idle for too long. The list is
+        oldest first so we stop at the first connection that is still fresh.
+        """
+        while conns and now - conns[0][1] > self.idle_timeout:
+            conn, last_used = conns.pop(0)
+            conn.close()
+            self.evictions += 1
+
+    def get(self, key):
+        """
+        Return an idle connection for "key" or None if there is not one.
+        """
+        with self.lock:
+            conns = self.idle.get(key)
+            if conns:
+                self._evict(conns, time.time())
+            if conns:
+                self.hits += 1
+                return conns.pop()[0]
+            self.misses += 1
+            return None
+
+    def put(self, key, conn):
+        """
+        Give a connection back to the pool, if the pool for "key" is full the
+        connection is closed.
+        """
+        with self.lock:
+            conns = self.idle.setdefault(key, [])
+            self._evict(conns, time.time())
+            if len(conns) < self.pool_size:
+                conns.append((conn, time.time()))
+                return
+        conn.close()
+
+    def count_reconnect(self):
+        """
+        Count a request that was sent again because its pooled connection
+        had been closed by the server.
+        """
+        with self.lock:
+            self.reconnects += 1
+
+    def close_all(self):
+        """
+        Close every idle connection in the pool.
+        """
+        with self.lock:
+            for conns in self.idle.values():
+                for conn, last_used in conns:
+                    conn.close()
+            self.idle = {}
+
+    def stats(self):
+        """
+        Return the pool counters and the number of idle connections per host.
+        """
+        with self.lock:
+            idle = dict((key, len(conns)) for key, conns in self.idle.items())
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'reconnects': self.reconnects,
+                    'evictions': self.evictions,
+                    'idle': idle}
 
 
 class Connections(object):
     def __init__(self, m_args, output):
         """
-        Open, Prep, or Close a connection to the OpenStack API
+        Open, Prep, or Close a connection to the OpenStack API. Connections are
+        kept alive and reused, the size of the pool can be set with
+        "m_args['pool_size']" and the idle time with
+        "m_args['pool_idle_timeout']".
+
+        If "re_auth" is set to a callable it will be used to get a new token
+        when the API tells us that our token is no longer valid, after which
+        the request is replayed.
+
+        If "m_args['rate_limit']" is True the rate limits of the account are
+        loaded from the API and requests are delayed so that they stay under
+        them. A request that is still rate limited is made again once the time
+        given by "Retry-After" has passed, up to "m_args['rate_limit_retries']"
+        times.
+
+        "m_args['retry']" sets how requests that fail for a reason that is
+        likely to pass, IE a 503 or a reset connection, are made again. It is
+        a "retry.RetryPolicy", a dictionary of arguments for one, or True for
+        the defaults. The attempts made and the seconds spent waiting between
+        them are put in "args['nova_attempts']" and "args['nova_backoff']".
+
+        If "m_args['trace']" is a callable, IE a "tracing.SpanCollector", it is
+        given a "tracing.Span" with the time spent in each phase of every call,
+        the span is also put in "args['nova_trace']".
+
+        Responses are asked for gzip or deflate encoded and are decompressed
+        as they are read, "m_args['compression'] = False" turns this off.
+        If "m_args['compress_requests']" is a number of bytes, request bodies
+        of at least that size are sent gzipped, IE a boot request with large
+        personality files. The bytes sent and received, before and after
+        compression, are put in "args['nova_transfer']".
+
+        If "m_args['http_cache']" is set, see "httpcache.from_args", GET
+        responses that have an "ETag" or "Last-Modified" are kept and the
+        next GET of the same path asks the API for the response only if it
+        has changed. When it has not the kept response is used and
+        "args['nova_cached']" is True.
+
+        The actions return a "response.Response" made from "args", nothing
+        about a call is written to "m_args".
         """
         self.output = output
         self.m_args = m_args
         self.resp_exp = statuscodes.ResultExceptions(self.output)
+        self.pool = ConnectionPool(
+            pool_size=m_args.get('pool_size') or 10,
+            idle_timeout=m_args.get('pool_idle_timeout') or 60
+        )
+        self.endpoints = {}
+        self.re_auth = None
+        self.auth_lock = threading.Lock()
+        self.limiter = None
+        self.limiter_lock = threading.Lock()
+        self.retry_policy = retry.from_args(m_args)
+        self.tracer = m_args.get('trace')
+        self.compression = m_args.get('compression', True)
+        self.compress_min = m_args.get('compress_requests')
+        self.http_cache = httpcache.from_args(m_args, output=output)
 
     def _conn(self, url):
         """
@@ -35,33 +210,320 @@ class Connections(object):
         protocol to https, this is done with by setting the
         "m_args['use_https']" argument to "True"
         """
-        if not self.m_args['use_https']:
-            self.conn = httplib.HTTPConnection(url)
+        if self.tracer is not None:
+            if not self.m_args['use_https']:
+                conn = tracing.TracedHTTPConnection(url)
+            else:
+                conn = tracing.TracedHTTPSConnection(url)
+        elif not self.m_args['use_https']:
+            conn = httplib.HTTPConnection(url)
         else:
-            self.conn = httplib.HTTPSConnection(url)
+            conn = httplib.HTTPSConnection(url)
 
         if self.m_args['os_verbose']:
-            self.conn.set_debuglevel(1)
-        return self.conn
+            conn.set_debuglevel(1)
+        return conn
+
+    def _endpoint(self, endpoint_uri):
+        """
+        Split the "endpoint_uri" into the host and the base path. The result is
+        cached so that the endpoint is only parsed once.
+        """
+        if endpoint_uri not in self.endpoints:
+            endpoint = endpoint_uri.strip('http?s://')
+            url_data = endpoint.split('/')
+            base_path = '/%s' % '/'.join(url_data[1:])
+            self.endpoints[endpoint_uri] = (url_data[0], base_path)
+        return self.endpoints[endpoint_uri]
 
     def _conn_prep(self, path, endpoint_uri):
         """
         Setup a connection for the "path" provided to it. Using this method will
-        set the default headers as well as use the "endpoint_url" method.
+        set the default headers as well as use the "endpoint_url" method. If
+        there is an idle connection in the pool for the host it will be used.
         """
         headers = {'X-Auth-Token': self.m_args['token'],
                    'Content-type': 'application/json'}
-        endpoint = endpoint_uri.strip('http?s://')
-        url_data = endpoint.split('/')
-        url = url_data[0]
-        c_path = '/%s%s' % ('/'.join(url_data[1:]), path)
-        self.output.info('Connecting to the API for %s' % path)
-        self.conn = self._conn(url)
+        if self.compression:
+            headers['Accept-Encoding'] = compression.ACCEPT_ENCODING
+        url, base_path = self._endpoint(endpoint_uri)
+        c_path = '%s%s' % (base_path, path)
+        self.output.info('Connecting to the API for %s', path)
+        conn = self.pool.get((self.m_args['use_https'], url))
+        if conn is None:
+            conn = self._conn(url)
         if self.m_args['os_verbose']:
-            self.output.debug('%s %s\n' % (headers, c_path))
-        return c_path, headers, url, self.conn
+            self.output.debug('%s %s\n', headers, c_path)
+        return c_path, headers, url, conn
+
+    def _release(self, url, conn, resp):
+        """
+        Return a connection to the pool unless the server told us that it will
+        close the connection.
+        """
+        if resp.will_close:
+            conn.close()
+        else:
+            self.pool.put((self.m_args['use_https'], url), conn)
+
+    def _refresh_token(self, stale_token):
+        """
+        Get a new token after "stale_token" was rejected. Only one thread will
+        re-authenticate, any other thread that was rejected at the same time
+        waits on the lock and then uses the new token. Returns True if we have
+        a token that is different from "stale_token".
+        """
+        with self.auth_lock:
+            if self.m_args.get('token') == stale_token:
+                self.output.info('Token was rejected, Re-Authenticating')
+                try:
+                    self.re_auth()
+                except Exception:
+                    self.output.error(traceback.format_exc())
+            return self.m_args.get('token') != stale_token
+
+    def _send(self, method, path, args, body=None, span=None,
+              extra_headers=None):
+        """
+        Send a request using a pooled connection and return the response
+        without reading it. If a reused connection had been closed by the
+        server before it got the request the request is sent again on a new
+        connection, any other error is raised as it may have been done. The
+        caller has to read the response and then give the connection to
+        "_release". If "span" is given the time to connect and to the first
+        byte are added to it.
+        "extra_headers" are added to the default headers.
+        """
+        _cp = self._conn_prep(path,
+                              endpoint_uri=args['nova_endpoint'])
+        c_path, headers, url, conn = _cp
+        if extra_headers:
+            headers.update(extra_headers)
+        if span is not None:
+            started = time.time()
+        reused = conn.sock is not None
+        try:
+            writing = True
+            conn.request(method, c_path, _body(body), headers=headers)
+            writing = False
+            resp = conn.getresponse()
+        except (httplib.HTTPException, socket.error), exp:
+            conn.close()
+            if not reused or not _stale(exp, writing):
+                raise
+            self.pool.count_reconnect()
+            self.output.debug('Connection to %s was closed, reconnecting', url)
+            conn = self._conn(url)
+            conn.request(method, c_path, _body(body), headers=headers)
+            resp = conn.getresponse()
+        if span is not None:
+            elapsed = time.time() - started
+            for phase, seconds in (tracing.take_phases(conn) or {}).items():
+                span.add(phase, seconds)
+                elapsed -= seconds
+            span.add('ttfb', elapsed)
+            if body is not None:
+                span.sent += len(body)
+        return resp, conn, headers, url
+
+    def _rate_limiter(self, args):
+        """
+        Return the RateLimiter for the account, loading the rate limits from
+        the API the first time. If the limits can not be loaded the request
+        is not delayed and the limits are asked for again by the next one,
+        IE after our token has been renewed.
+        """
+        with self.limiter_lock:
+            if self.limiter is not None:
+                return self.limiter
+            try:
+                resp, conn, headers, url = self._send('GET', '/limits', args)
+                try:
+                    read_resp = compression.Decoder(resp).read()
+                except Exception:
+                    conn.close()
+                    raise
+                self._release(url, conn, resp)
+                if resp.status < 300 and read_resp:
+                    rates = json.loads(read_resp)['limits'].get('rate', [])
+                    self.limiter = ratelimit.RateLimiter(rates=rates)
+                    return self.limiter
+                self.output.warn('Could not load the rate limits, STATUS %s',
+                                 resp.status)
+            except Exception:
+                self.output.error(traceback.format_exc())
+            return ratelimit.RateLimiter()
+
+    def _throttle(self, method, path, args):
+        """
+        Wait until the request can be made without going over a rate limit.
+        """
+        if self.m_args.get('rate_limit'):
+            limiter = self._rate_limiter(args)
+            waited = limiter.acquire(method, path)
+            if waited:
+                self.output.debug('Waited %.2f seconds for the rate limit on'
+                                  ' %s %s', waited, method, path)
+
+    def _backoff(self, method, path, state, reason):
+        """
+        Wait before the next attempt of a request and count the time waited.
+        """
+        delay = self.retry_policy.delay(state['attempts'])
+        self.output.warn('%s %s failed with %s, attempt %s of %s in %.2f'
+                         ' seconds', method, path, reason,
+                         state['attempts'] + 1, self.retry_policy.max_attempts,
+                         delay)
+        time.sleep(delay)
+        state['backoff'] += delay
+
+    def _trace(self, args):
+        """
+        Give the span of a call, if it was traced, to the tracer. Returns
+        "args".
+        """
+        span = args.get('nova_trace')
+        if span is not None:
+            try:
+                self.tracer(span)
+            except Exception:
+                self.output.error(traceback.format_exc())
+        return args
+
+    def _respond(self, resp, args):
+        """
+        Give the span of a call to the tracer and return the call as a
+        "response.Response".
+        """
+        self._trace(args)
+        return response.Response.from_args(args,
+                                           headers=dict(resp.getheaders()))
+
+    def _decode(self, read_resp, args):
+        """
+        Decode a JSON response, timing it if the call is traced.
+        """
+        span = args.get('nova_trace')
+        if span is None:
+            return json.loads(read_resp)
+        started = time.time()
+        json_response = json.loads(read_resp)
+        span.add('decode', time.time() - started)
+        return json_response
+
+    def _again(self, method, path, args, resp, headers, state):
+        """
+        Return True if a request that got the failed response "resp" should
+        be made again, after waiting if we have to. If our token was rejected
+        we re-authenticate and replay the request once. If we were rate
+        limited and the API told us when to try again, the request is made
+        again after that time. Errors that are likely to pass are retried as
+        set by the retry policy.
+        """
+        if resp.status == 401 and self.re_auth and not state['reauthed']:
+            state['reauthed'] = True
+            return self._refresh_token(stale_token=headers['X-Auth-Token'])
+        elif (resp.status in (413, 429) and
+              self.m_args.get('rate_limit') and
+              state['throttled'] < self.m_args.get('rate_limit_retries', 3)):
+            delay = ratelimit.retry_after(resp.getheader('retry-after'))
+            if delay is not None:
+                state['throttled'] += 1
+                self.output.warn('Rate limited on %s %s, trying again in'
+                                 ' %s seconds', method, path, delay)
+                limiter = self._rate_limiter(args)
+                if not limiter.block(method, path, delay):
+                    time.sleep(delay)
+                return True
+        elif self.retry_policy.allows(method=method,
+                                      attempts=state['attempts'],
+                                      status=resp.status):
+            self._backoff(method, path, state, resp.status)
+            return True
+        return False
 
-    def check_status(self, resp, headers, authurl, jsonreq=None):
+    def _again_after_error(self, method, path, exp, state):
+        """
+        Return True if a request that raised "exp" should be made again.
+        """
+        if self.retry_policy.allows(method=method,
+                                    attempts=state['attempts'],
+                                    exc=exp):
+            self._backoff(method, path, state, repr(exp))
+            return True
+        return False
+
+    def _request(self, method, path, args, body=None, extra_headers=None):
+        """
+        Make a request using a pooled connection. The whole response is read so
+        that the connection can be reused. A failed request is made again when
+        "_again" says that it should be. "extra_headers" are sent with the
+        request.
+        """
+        state = {'attempts': 0,
+                 'backoff': 0.0,
+                 'reauthed': False,
+                 'throttled': 0}
+        started = time.time()
+        sent = 0
+        if body is not None:
+            sent = len(body)
+        body, encoding = compression.encode(body, min_size=self.compress_min)
+        extra_headers = dict(extra_headers or {})
+        if encoding is not None:
+            extra_headers['Content-Encoding'] = encoding
+        span = None
+        if self.tracer is not None:
+            span = args['nova_trace'] = tracing.Span(method, path)
+        while True:
+            state['attempts'] += 1
+            self._throttle(method, path, args)
+            try:
+                resp, conn, headers, url = self._send(
+                    method, path, args,
+                    body=body,
+                    span=span,
+                    extra_headers=extra_headers
+                )
+                if span is not None:
+                    read_started = time.time()
+                decoder = compression.Decoder(resp)
+                try:
+                    read_resp = decoder.read()
+                except Exception:
+                    conn.close()
+                    raise
+                if span is not None:
+                    span.add('body', time.time() - read_started)
+                    span.received += len(read_resp)
+            except self.retry_policy.exceptions, exp:
+                if self._again_after_error(method, path, exp, state):
+                    continue
+                raise
+            self._release(url, conn, resp)
+
+            if resp.status >= 300 and self._again(method, path, args, resp,
+                                                  headers, state):
+                continue
+            args['nova_attempts'] = state['attempts']
+            args['nova_backoff'] = state['backoff']
+            args['nova_elapsed'] = time.time() - started
+            args['nova_transfer'] = {'sent': sent,
+                                     'sent_wire': len(body or ''),
+                                     'received': decoder.decoded_bytes,
+                                     'received_wire': decoder.wire_bytes}
+            if span is not None:
+                span.status = resp.status
+                span.attempts = state['attempts']
+            return resp, read_resp, headers, url
+
+    def close(self):
+        """
+        Close all of the pooled connections.
+        """
+        self.pool.close_all()
+
+    def check_status(self, resp, headers, authurl, jsonreq=None, args=None):
         """
         Check the status of the response that we get from the API. Note
         that the response is given to the response exception handler if the
@@ -69,100 +531,213 @@ class Connections(object):
         "status['nova_reason']" key with the data provided by the response
         status interperater. Also Note that the "status['nova_reason']" key
         will be set to a Tuple containing the headers if the response status is
-        above 300
+        above 300. The status is written to "args", which is the arguments of
+        the call being made, or to "m_args" if "args" is not given. A "304 Not
+        Modified" is not an error, the caller answers it from its HTTP cache.
         """
+        if args is None:
+            args = self.m_args
+
         # Status Data
-        self.m_args['nova_status'] = resp.status
-        self.m_args['nova_reason'] = resp.reason
-        if resp.status >= 300:
+        args['nova_status'] = resp.status
+        args['nova_reason'] = resp.reason
+        if resp.status >= 300 and resp.status != 304:
             data = self.resp_exp._resp_exp(resp=resp,
                                            headers=headers,
                                            authurl=authurl,
                                            jsonreq=jsonreq)
-            self.m_args['nova_resp'] = data
+            args['nova_resp'] = data
 
     def _delete_action(self, path, args):
         """
         Delete Request.
         """
-        _cp = self._conn_prep(path,
-                              endpoint_uri=args['nova_endpoint'])
-        path, headers, url, conn = _cp
-
-        conn.request('DELETE', path, headers=headers)
-        resp = conn.getresponse()
+        resp, read_resp, headers, url = self._request('DELETE', path, args)
 
         # Status Data
         self.check_status(resp=resp,
                           headers=headers,
                           authurl=url,
-                          jsonreq=None)
+                          jsonreq=None,
+                          args=args)
         if args['nova_status'] >= 300:
-            conn.close()
-            return args
+            return self._respond(resp, args)
 
-        read_resp = resp.read()
-        conn.close()
         args['nova_resp'] = read_resp
-        return args
+        return self._respond(resp, args)
 
     def _get_action(self, path, args):
         """
-        Get Request
+        Get Request. If there is an HTTP cache and it has the response for
+        "path" the request is only answered if the response has changed,
+        otherwise the cached response is used.
         """
-        _cp = self._conn_prep(path,
-                              endpoint_uri=args['nova_endpoint'])
-        path, headers, url, conn = _cp
-
-        conn.request('GET', path, headers=headers)
-        resp = conn.getresponse()
+        cache = self.http_cache
+        if cache is not None and not cache.cacheable(path):
+            cache = None
+        cached = None
+        if cache is not None:
+            key = cache.key(args, path)
+            cached = cache.get(key)
+        if cached is not None:
+            extra_headers = cached.headers()
+        else:
+            extra_headers = None
+        resp, read_resp, headers, url = self._request(
+            'GET', path, args, extra_headers=extra_headers
+        )
 
         # Status Data
         self.check_status(resp=resp,
                           headers=headers,
                           authurl=url,
-                          jsonreq=None)
-        if args['nova_status'] >= 300:
-            conn.close()
-            return args
+                          jsonreq=None,
+                          args=args)
+        if args['nova_status'] == 304 and cached is not None:
+            cache.count(hit=True)
+            args['nova_status'] = cached.status
+            args['nova_reason'] = cached.reason
+            args['nova_cached'] = True
+            read_resp = cached.body
+        elif args['nova_status'] >= 300:
+            if cache is not None and args['nova_status'] == 404:
+                cache.invalidate(key)
+            return self._respond(resp, args)
+        elif cache is not None:
+            cache.count(hit=False)
+            cache.put(key, resp, read_resp)
+
+        if read_resp:
+            json_response = self._decode(read_resp, args)
         else:
-            read_resp = resp.read()
-            conn.close()
-            if read_resp:
-                json_response = json.loads(read_resp)
-            else:
-                json_response = read_resp
-            args['nova_resp'] = json_response
-            return args
+            json_response = read_resp
+        args['nova_resp'] = json_response
+        return self._respond(resp, args)
 
     def _post_action(self, path, args, body):
         """
         Post Request
         """
-        _cp = self._conn_prep(path,
-                              endpoint_uri=args['nova_endpoint'])
-        path, headers, url, conn = _cp
-
-        conn.request('POST', path, body, headers=headers)
-        resp = conn.getresponse()
+        resp, read_resp, headers, url = self._request('POST', path, args,
+                                                      body=body)
 
         # Status Data
         self.check_status(resp=resp,
                           headers=headers,
                           authurl=url,
-                          jsonreq=body)
+                          jsonreq=body,
+                          args=args)
         if args['nova_status'] >= 300:
-            conn.close()
-            return args
+            return self._respond(resp, args)
 
-        read_resp = resp.read()
-        conn.close()
         if read_resp:
-            json_response = json.loads(read_resp)
+            json_response = self._decode(read_resp, args)
         else:
             json_response = read_resp
 
         if args['os_verbose']:
-            self.output.debug(json.dumps(json_response, indent=2))
+            self.output.debug('%s', logger.Dump(json_response, indent=2))
         args['nova_resp'] = json_response
-        return args
+        return self._respond(resp, args)
+
+    def _stream_action(self, path, args, collection, fields=None):
+        """
+        Streaming Get Request. The items of "collection" are parsed and
+        yielded as the response is read instead of reading the whole response
+        first. If "fields" is a list of dotted field names, IE ['id',
+        'flavor.id'], only those fields of each item are parsed. Once the
+        response has been read "args['nova_resp']" holds the rest of the
+        response, IE the "servers_links", and "args['nova_stream']" holds the
+        number of items, the bytes read before and after decompression and
+        the seconds until the first item.
+        Only the request is retried, never a response that is part read.
+        When traced the "body" phase of the span covers reading and parsing
+        the response, including the time the caller spends on each item.
+        """
+        started = time.time()
+        state = {'attempts': 0,
+                 'backoff': 0.0,
+                 'reauthed': False,
+                 'throttled': 0}
+        span = None
+        if self.tracer is not None:
+            span = args['nova_trace'] = tracing.Span('GET', path)
+        while True:
+            state['attempts'] += 1
+            self._throttle('GET', path, args)
+            try:
+                resp, conn, headers, url = self._send('GET', path, args,
+                                                      span=span)
+            except self.retry_policy.exceptions, exp:
+                if self._again_after_error('GET', path, exp, state):
+                    continue
+                raise
+            if resp.status < 300:
+                break
+
+            resp.read()
+            self._release(url, conn, resp)
+            if self._again('GET', path, args, resp, headers, state):
+                continue
+
+            # Status Data
+            args['nova_attempts'] = state['attempts']
+            args['nova_backoff'] = state['backoff']
+            self.check_status(resp=resp,
+                              headers=headers,
+                              authurl=url,
+                              jsonreq=None,
+                              args=args)
+            if span is not None:
+                span.status = resp.status
+                span.attempts = state['attempts']
+                self._trace(args)
+            return
+
+        args['nova_attempts'] = state['attempts']
+        args['nova_backoff'] = state['backoff']
+        self.check_status(resp=resp,
+                          headers=headers,
+                          authurl=url,
+                          jsonreq=None,
+                          args=args)
+        stats = args['nova_stream'] = {'items': 0,
+                                       'bytes': 0,
+                                       'wire_bytes': 0,
+                                       'first_item': None}
+        args['nova_resp'] = {}
+        decoder = compression.Decoder(resp)
+        parser = jsonstream.StreamParser(decoder)
+        if span is not None:
+            span.status = resp.status
+            span.attempts = state['attempts']
+            read_started = time.time()
+        finished = False
+        try:
+            items = parser.iter_collection(collection,
+                                           fields=fields,
+                                           extra=args['nova_resp'])
+            for item in items:
+                if stats['first_item'] is None:
+                    stats['first_item'] = time.time() - started
+                stats['items'] += 1
+                yield item
+            decoder.read()
+            finished = True
+        finally:
+            stats['bytes'] = parser.bytes_read
+            stats['wire_bytes'] = decoder.wire_bytes
+            args['nova_transfer'] = {'sent': 0,
+                                     'sent_wire': 0,
+                                     'received': decoder.decoded_bytes,
+                                     'received_wire': decoder.wire_bytes}
+            if span is not None:
+                span.add('body', time.time() - read_started)
+                span.received += parser.bytes_read
+                self._trace(args)
+            if finished:
+                self._release(url, conn, resp)
+            else:
+                # The response was not read to the end, the connection can not
+                # be used again.
+                conn.close()
@@ -0,0 +1,313 @@
+# ==============================================================================
+# Copyright [2013] [Kevin Carter]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import traceback
+
+
+# The bytes of response bodies kept in memory, and on disk, by default
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+DEFAULT_MAX_DISK_BYTES = 64 * 1024 * 1024
+
+# Requests that are not cached. A "changes-since" query is different every
+# time it is asked and a single server is polled while it builds, keeping them
+# would only fill the cache. An image rarely changes, so it is cached.
+VOLATILE = (re.compile(r'[?&]changes-since='),
+            re.compile(r'^/servers/(?!detail\b)[^/?]+'))
+
+
+class Entry(object):
+    __slots__ = ('etag', 'last_modified', 'status', 'reason', 'body',
+                 'stored')
+
+    def __init__(self, etag, last_modified, status, reason, body,
+                 stored=None):
+        """
+        A cached response, "body" is the JSON text that the API sent. The
+        text is kept, and not the parsed response, so that every caller gets
+        its own copy to change.
+        """
+        self.etag = etag
+        self.last_modified = last_modified
+        self.status = status
+        self.reason = reason
+        self.body = body
+        self.stored = stored or time.time()
+
+    def headers(self):
+        """
+        Return the headers that ask the API to send the response only if it
+        has changed.
+        """
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def as_dict(self):
+        return {'etag': self.etag,
+                'last_modified': self.last_modified,
+                'status': self.status,
+                'reason': self.reason,
+                'body': self.body,
+                'stored': self.stored}
+
+
+class HTTPCache(object):
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, cache_dir=None,
+                 output=None, max_disk_bytes=DEFAULT_MAX_DISK_BYTES):
+        """
+        Keep the responses to GET requests that came with an "ETag" or a
+        "Last-Modified" header. A cached response is never used without
+        asking the API, the request is sent with "If-None-Match" or
+        "If-Modified-Since" and if the API answers "304 Not Modified" the
+        cached body is used instead of downloading it again.
+
+        At most "max_bytes" of bodies are kept in memory, the least recently
+        used are dropped first. If "cache_dir" is given every entry is also
+        written there, so that other processes, and later runs, can use it.
+        The files take at most "max_disk_bytes", the files that were used
+        least recently are removed first. Paths that match "VOLATILE" are
+        never cached.
+        """
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.output = output
+        self.cache_dir = cache_dir
+        self.disk_size = 0
+        if cache_dir is not None:
+            self.cache_dir = os.path.expanduser(cache_dir)
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir, 0700)
+            self.disk_size = sum(size for _, size, _ in self._files())
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.order = []
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def cacheable(self, path):
+        """
+        Return True if the response to a GET of "path" may be cached.
+        """
+        return not any(regex.search(path) for regex in VOLATILE)
+
+    def key(self, args, path):
+        """
+        Return the cache key of "path" for the endpoint and the user and
+        tenant that the token of "args" belongs to, so that one user is never
+        given what another was allowed to see.
+        """
+        key = '%s|%s|%s|%s' % (args.get('nova_endpoint'),
+                               args.get('tenantid') or args.get('os_tenant'),
+                               args.get('os_user'),
+                               path)
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, 'http-%s.json' % key)
+
+    def _files(self):
+        """
+        Return the (last used, size, path) of every file in the cache
+        directory.
+        """
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if not (name.startswith('http-') and name.endswith('.json')):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def _prune(self):
+        """
+        Remove the files that were used least recently until the cache
+        directory is under "max_disk_bytes". Other processes may share the
+        directory so the files are counted again first.
+        """
+        files = sorted(self._files())
+        size = sum(size for _, size, _ in files)
+        for _, f_size, path in files:
+            if size <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= f_size
+            self.evictions += 1
+        self.disk_size = size
+
+    def _drop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.order.remove(key)
+            self.size -= len(entry.body)
+
+    def _keep(self, key, entry):
+        """
+        Put "entry" in memory, dropping the least recently used entries
+        until it fits.
+        """
+        self._drop(key)
+        if len(entry.body) > self.max_bytes:
+            return
+        while self.order and self.size + len(entry.body) > self.max_bytes:
+            self._drop(self.order[0])
+            self.evictions += 1
+        self.entries[key] = entry
+        self.order.append(key)
+        self.size += len(entry.body)
+
+    def _load(self, key):
+        path = self._path(key)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with open(path) as c_file:
+                data = json.load(c_file)
+            data['body'] = data['body'].encode('utf-8')
+            entry = Entry(**data)
+            # The time of the file is when it was last used
+            os.utime(path, None)
+            return entry
+        except (IOError, ValueError, KeyError, TypeError):
+            if self.output is not None:
+                self.output.error(traceback.format_exc())
+            return None
+
+    def _save(self, key, entry):
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.http-')
+        try:
+            with os.fdopen(fd, 'w') as c_file:
+                json.dump(entry.as_dict(), c_file)
+            size = os.path.getsize(temp_path)
+            if size > self.max_disk_bytes:
+                os.remove(temp_path)
+                return
+            if os.path.isfile(self._path(key)):
+                size -= os.path.getsize(self._path(key))
+            os.rename(temp_path, self._path(key))
+        except (IOError, OSError, ValueError):
+            if self.output is not None:
+                self.output.error(traceback.format_exc())
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        with self.lock:
+            self.disk_size += size
+            if self.disk_size > self.max_disk_bytes:
+                self._prune()
+
+    def get(self, key):
+        """
+        Return the Entry for "key" or None.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.order.remove(key)
+                self.order.append(key)
+                return entry
+        if self.cache_dir is None:
+            return None
+        entry = self._load(key)
+        if entry is not None:
+            with self.lock:
+                self._keep(key, entry)
+        return entry
+
+    def put(self, key, resp, body):
+        """
+        Keep "body", the response to a GET, if "resp" has a validator.
+        """
+        etag = resp.getheader('etag')
+        last_modified = resp.getheader('last-modified')
+        if not etag and not last_modified:
+            return
+        entry = Entry(etag=etag,
+                      last_modified=last_modified,
+                      status=resp.status,
+                      reason=resp.reason,
+                      body=body)
+        with self.lock:
+            self._keep(key, entry)
+        if self.cache_dir is not None:
+            self._save(key, entry)
+
+    def invalidate(self, key):
+        """
+        Forget the entry for "key".
+        """
+        with self.lock:
+            self._drop(key)
+        if self.cache_dir is not None and os.path.isfile(self._path(key)):
+            size = os.path.getsize(self._path(key))
+            os.remove(self._path(key))
+            with self.lock:
+                self.disk_size -= size
+
+    def count(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        """
+        Return the cache counters, the bytes held in memory and the bytes
+        of the files written to the cache directory.
+        """
+        with self.lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'entries': len(self.entries),
+                    'bytes': self.size,
+                    'disk_bytes': self.disk_size}
+
+
+def from_args(m_args, output=None):
+    """
+    Return the HTTPCache set as "m_args['http_cache']" or None. The value can
+    be an HTTPCache, to share one between clients, a dictionary of the
+    arguments for one, IE {'max_bytes': 8388608, 'cache_dir': '~/.cache',
+    'max_disk_bytes': 33554432},
+    or True for a memory only cache of the default size.
+    """
+    cache = m_args.get('http_cache')
+    if isinstance(cache, HTTPCache):
+        return cache
+    elif isinstance(cache, dict):
+        return HTTPCache(output=output, **cache)
+    elif cache:
+        return HTTPCache(output=output)
+    return None
@@ -0,0 +1,206 @@
+# ==============================================================================
+# Copyright [2013] [Kevin Carter]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import threading
+import time
+
+# Local Imports
+from bookofnova import timeutils
+
+
+# The indexes that are kept for every server
+INDEXES = ('status', 'flavor', 'image', 'name', 'metadata')
+
+
+def _reference(value):
+    """
+    The flavor and image of a server are given as {"id": ...}, a boot request
+    gives them as a plain ID.
+    """
+    if isinstance(value, dict):
+        return value.get('id')
+    return value
+
+
+def _index_keys(server):
+    """
+    Return the (index, key) pairs that "server" is found under.
+    """
+    keys = []
+    if server.get('status'):
+        keys.append(('status', server['status'].upper()))
+    if _reference(server.get('flavor')):
+        keys.append(('flavor', str(_reference(server['flavor']))))
+    if _reference(server.get('image')):
+        keys.append(('image', str(_reference(server['image']))))
+    if server.get('name') is not None:
+        keys.append(('name', server['name']))
+    for key in server.get('metadata') or {}:
+        keys.append(('metadata', key))
+    return keys
+
+
+class Inventory(object):
+    def __init__(self, nova, page_size=None, skew=5):
+        """
+        A local copy of the servers in the account, kept up to date by asking
+        the API only for the servers that changed. "nova" is the NovaCommands
+        used to list servers. The servers are indexed by status, flavor ID,
+        image ID, name and metadata key so that questions like "which servers
+        are in ERROR" are answered without asking the API.
+
+        The first "sync" lists every server, after that "sync" lists the
+        servers that have changed since the last one, including those that
+        were deleted. "skew" is the number of seconds each "changes-since"
+        goes back to allow for changes made while the last list was built.
+        """
+        self.nova = nova
+        self.page_size = page_size
+        self.skew = skew
+        self.lock = threading.RLock()
+        self.servers = {}
+        self.indexes = dict((index, {}) for index in INDEXES)
+        self.since = None
+        self.synced = None
+
+    def _add(self, server):
+        self._remove(server['id'])
+        self.servers[server['id']] = server
+        for index, key in _index_keys(server):
+            self.indexes[index].setdefault(key, set()).add(server['id'])
+
+    def _remove(self, server_id):
+        server = self.servers.pop(server_id, None)
+        if server is None:
+            return
+        for index, key in _index_keys(server):
+            ids = self.indexes[index].get(key)
+            if ids is not None:
+                ids.discard(server_id)
+                if not ids:
+                    del self.indexes[index][key]
+
+    def _find(self, index, key):
+        with self.lock:
+            return [self.servers[server_id] for server_id
+                    in self.indexes[index].get(key, ())]
+
+    def sync(self):
+        """
+        Bring the inventory up to date and return the number of servers that
+        were added, changed or removed. Nothing is changed if a page of the
+        list fails, the next "sync" will ask for the same changes again.
+        """
+        params = {}
+        if self.since is not None:
+            params['changes-since'] = timeutils.iso8601(self.since)
+        started = time.time()
+        newest = None
+        servers = list(self.nova.iter_servers_detail(page_size=self.page_size,
+                                                     stream=True,
+                                                     **params))
+        for server in servers:
+            updated = timeutils.parse_iso8601(server.get('updated'))
+            newest = max(newest, updated)
+
+        with self.lock:
+            if not params:
+                self.servers = {}
+                self.indexes = dict((index, {}) for index in INDEXES)
+            for server in servers:
+                if server.get('status', '').upper() == 'DELETED':
+                    self._remove(server['id'])
+                else:
+                    self._add(server)
+            if newest is not None:
+                self.since = max(self.since, newest - self.skew)
+            elif self.since is None:
+                self.since = started - self.skew
+            self.synced = time.time()
+        self.nova.output.info('Inventory synced, %s servers changed, %s'
+                              ' servers known', len(servers),
+                              len(self.servers))
+        return len(servers)
+
+    def booted(self, action, server=None):
+        """
+        Add a server that we just asked the API to build. "action" is what
+        "booter" returned and "server" is the name, flavor, image and
+        metadata the body was built with, see "computelib.BootBody". The next
+        "sync" fills in the rest of the details.
+        """
+        if self.synced is None:
+            return
+        created = action['nova_resp'].get('server') or {}
+        if 'id' not in created:
+            return
+        with self.lock:
+            self._add(dict(server or {}, id=created['id'], status='BUILD'))
+
+    def deleted(self, server_id):
+        """
+        Remove a server that we just deleted.
+        """
+        with self.lock:
+            self._remove(server_id)
+
+    def get(self, server_id):
+        """
+        Return the server with the ID "server_id" or None.
+        """
+        with self.lock:
+            return self.servers.get(server_id)
+
+    def all(self):
+        """
+        Return all of the known servers.
+        """
+        with self.lock:
+            return self.servers.values()
+
+    def by_status(self, status):
+        """
+        Return the servers that have "status", IE "ERROR".
+        """
+        return self._find('status', status.upper())
+
+    def by_flavor(self, flavor_id):
+        """
+        Return the servers that were built with the flavor "flavor_id".
+        """
+        return self._find('flavor', str(flavor_id))
+
+    def by_image(self, image_id):
+        """
+        Return the servers that were built from the image "image_id".
+        """
+        return self._find('image', str(image_id))
+
+    def by_name(self, name):
+        """
+        Return the servers named "name".
+        """
+        return self._find('name', name)
+
+    def with_metadata(self, key, value=None):
+        """
+        Return the servers that have the metadata "key", and if "value" is
+        given, only those where it is set to "value".
+        """
+        servers = self._find('metadata', key)
+        if value is None:
+            return servers
+        return [server for server in servers
+                if server['metadata'].get(key) == value]
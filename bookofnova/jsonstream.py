@@ -0,0 +1,238 @@
+# ==============================================================================
+# Copyright [2013] [Kevin Carter]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import json
+import re
+
+
+WHITESPACE = re.compile(r'\s*')
+STRING = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+STRUCTURE = re.compile(r'["{}\[\]]')
+SCALAR = re.compile(r'[^,:}\]\s]+')
+
+# A leaf of a projection tree that keeps the raw JSON text of the value
+RAW = object()
+
+
+class StreamError(Exception):
+    pass
+
+
+def projection(fields):
+    """
+    Turn a list of dotted field names, IE ['id', 'status', 'flavor.id'], into
+    the tree used by "StreamParser", IE {'id': None, 'status': None,
+    'flavor': {'id': None}}. None means that the whole value is kept and
+    "RAW" that the value is kept as the JSON text, without being parsed.
+    """
+    tree = {}
+    for field in fields:
+        branch = tree
+        parts = field.split('.')
+        for part in parts[:-1]:
+            if branch.get(part, {}) is None:
+                break
+            branch = branch.setdefault(part, {})
+        else:
+            branch[parts[-1]] = None
+    return tree
+
+
+class StreamParser(object):
+    def __init__(self, source, chunk_size=65536):
+        """
+        Parse a JSON document as it is read from "source", which is anything
+        with a "read(size)" method such as an HTTP response. Only "chunk_size"
+        bytes plus the value being parsed are held in memory at any time.
+        """
+        self.source = source
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.bytes_read = 0
+
+    def _fill(self, keep=None):
+        """
+        Read more data into the buffer. Everything before "keep", or the
+        current position, is thrown away. Returns the new position of "keep".
+        """
+        if keep is None:
+            keep = self.pos
+        chunk = self.source.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+        self.bytes_read += len(chunk)
+        self.pos -= keep
+        self.buf = self.buf[keep:] + chunk
+        return 0
+
+    def _peek(self):
+        """
+        Skip whitespace and return the next character without using it.
+        """
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            elif self.eof:
+                raise StreamError('Unexpected end of the JSON document')
+            self._fill()
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise StreamError('Expected "%s" at "%s"'
+                              % (char, self.buf[self.pos:self.pos + 20]))
+        self.pos += 1
+
+    def _raw_value(self, capture=True):
+        """
+        Scan over the next value. If "capture" is True the raw JSON text of
+        the value is returned, otherwise the value is skipped without keeping
+        any of it.
+        """
+        first = self._peek()
+        start = self.pos
+        pieces = []
+
+        def refill(start):
+            if capture:
+                pieces.append(self.buf[start:self.pos])
+            if self.eof:
+                raise StreamError('Unexpected end of the JSON document')
+            self._fill(keep=self.pos)
+            return self.pos
+
+        if first == '"':
+            self.pos += 1
+            while True:
+                match = STRING.match(self.buf, self.pos)
+                if match:
+                    self.pos = match.end()
+                    break
+                start = refill(start)
+        elif first in '{[':
+            self.pos += 1
+            depth = 1
+            while depth:
+                match = STRUCTURE.search(self.buf, self.pos)
+                if not match:
+                    self.pos = len(self.buf)
+                    start = refill(start)
+                    continue
+                char = match.group()
+                if char == '"':
+                    string = STRING.match(self.buf, match.end())
+                    if not string:
+                        self.pos = match.start()
+                        start = refill(start)
+                        continue
+                    self.pos = string.end()
+                else:
+                    self.pos = match.end()
+                    if char in '{[':
+                        depth += 1
+                    else:
+                        depth -= 1
+        else:
+            if SCALAR.match(self.buf, self.pos) is None:
+                raise StreamError('Unexpected "%s" in the JSON document'
+                                  % first)
+            while True:
+                match = SCALAR.match(self.buf, self.pos)
+                if match:
+                    self.pos = match.end()
+                if self.pos < len(self.buf) or self.eof:
+                    break
+                start = refill(start)
+
+        if capture:
+            pieces.append(self.buf[start:self.pos])
+            return ''.join(pieces)
+
+    def _key(self):
+        raw = self._raw_value()
+        if '\\' in raw:
+            return json.loads(raw)
+        return raw[1:-1].decode('utf-8')
+
+    def _members(self):
+        """
+        Yield the keys of the object that starts at the current position. The
+        caller has to use, or skip, the value of each key before asking for
+        the next one.
+        """
+        self._expect('{')
+        if self._peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self._key()
+            self._expect(':')
+            yield key
+            char = self._peek()
+            self.pos += 1
+            if char == '}':
+                return
+            elif char != ',':
+                raise StreamError('Expected "," or "}" not "%s"' % char)
+
+    def value(self, fields=None):
+        """
+        Parse the next value. When "fields" is a projection tree only those
+        members of an object are parsed, everything else is skipped over
+        without being built.
+        """
+        if fields is RAW:
+            return self._raw_value()
+        if fields is None or self._peek() != '{':
+            return json.loads(self._raw_value())
+        obj = {}
+        for key in self._members():
+            if key in fields:
+                obj[key] = self.value(fields=fields[key])
+            else:
+                self._raw_value(capture=False)
+        return obj
+
+    def iter_collection(self, collection, fields=None, extra=None):
+        """
+        Yield the items of the list "collection" found in the top level object
+        of the document, IE the servers in {"servers": [...]}, one at a time.
+        If "fields" is given it is a list of dotted field names, or a
+        projection tree, and only those fields are parsed for each item. Any
+        other top level members are parsed and put in the "extra" dictionary.
+        """
+        if fields is not None and not isinstance(fields, dict):
+            fields = projection(fields)
+        for key in self._members():
+            if key != collection:
+                value = self.value()
+                if extra is not None:
+                    extra[key] = value
+                continue
+
+            self._expect('[')
+            if self._peek() == ']':
+                self.pos += 1
+                continue
+            while True:
+                yield self.value(fields=fields)
+                char = self._peek()
+                self.pos += 1
+                if char == ']':
+                    break
+                elif char != ',':
+                    raise StreamError('Expected "," or "]" not "%s"' % char)
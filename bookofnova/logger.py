@@ -13,23 +13,132 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ==============================================================================
+import Queue
+import atexit
+import json
 import logging
 import os
+import threading
 from bookofnova.info import __appname__ as appname
 
 
+# The most characters of a request or a response that are put in a log message
+DUMP_LIMIT = 4096
+
+
 class NoLogLevelSet(Exception):
     pass
 
 
+class Dump(object):
+    __slots__ = ('data', 'limit', 'indent')
+
+    def __init__(self, data, limit=DUMP_LIMIT, indent=None):
+        """
+        A request or response to be logged, IE
+        "output.debug('RESPONSE %s', logger.Dump(json_response))". The data is
+        only turned into text if the message is written, and then only the
+        first "limit" characters are kept.
+        """
+        self.data = data
+        self.limit = limit
+        self.indent = indent
+
+    def __str__(self):
+        data = self.data
+        if hasattr(data, 'copy') and hasattr(data, 'read'):
+            # A streamed body, only read what will be logged
+            text = data.copy().read(self.limit + 1)
+            length = len(data)
+        else:
+            if data is None:
+                data = 'None'
+            elif not isinstance(data, basestring):
+                try:
+                    data = json.dumps(data, indent=self.indent)
+                except (TypeError, ValueError):
+                    data = repr(data)
+            text = data
+            length = len(text)
+        if length > self.limit:
+            return '%s... [%s more characters]' % (text[:self.limit],
+                                                   length - self.limit)
+        return text
+
+
+class BackgroundHandler(logging.Handler):
+    def __init__(self, handler, max_queue=10000):
+        """
+        Give log records to "handler" on a thread of its own so that writing
+        the log never holds up a call to the API. The message is built before
+        the record is queued. If more than "max_queue" records are waiting
+        new records are dropped and counted in "dropped".
+        """
+        logging.Handler.__init__(self)
+        self.handler = handler
+        self.queue = Queue.Queue(max_queue)
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+        atexit.register(self.close)
+
+    def setFormatter(self, fmt):
+        logging.Handler.setFormatter(self, fmt)
+        self.handler.setFormatter(fmt)
+
+    def setLevel(self, level):
+        logging.Handler.setLevel(self, level)
+        self.handler.setLevel(level)
+
+    def emit(self, record):
+        try:
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                record.exc_text = logging.Formatter().formatException(
+                    record.exc_info
+                )
+                record.exc_info = None
+            self.queue.put_nowait(record)
+        except Queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def _run(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                break
+            try:
+                self.handler.handle(record)
+            except Exception:
+                self.handler.handleError(record)
+
+    def close(self):
+        """
+        Write everything that is queued and stop the thread.
+        """
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join(5)
+        self.handler.close()
+        logging.Handler.close(self)
+
+
 class Logging(object):
-    def __init__(self, log_level, log_file=None):
+    def __init__(self, log_level, log_file=None, background=False):
         self.log_level = log_level
         self.log_file = log_file
+        self.background = background
 
     def logger_setup(self):
         """
-        Setup logging for your application
+        Setup logging for your application. The handler for a log file, or for
+        the console, is only added once no matter how many times this is
+        called. If "background" is True when the handler is added the log is
+        written by a "BackgroundHandler".
         """
         logger = logging.getLogger("%s" % (appname.upper()))
 
@@ -47,12 +156,22 @@ class Logging(object):
         else:
             raise NoLogLevelSet('I died because you did not set a known log level')
 
+        # Reuse our Handeler if it has already been built
+        key = self.log_file and os.path.abspath(self.log_file)
+        for handler in logger.handlers:
+            if getattr(handler, 'bookofnova_key', None) == key:
+                handler.setLevel(lvl)
+                return logger
+
         # Building Handeler
         if self.log_file:
             handler = logging.FileHandler(self.log_file)
         else:
             handler = logging.StreamHandler()
+        if self.background:
+            handler = BackgroundHandler(handler)
 
+        handler.bookofnova_key = key
         handler.setLevel(lvl)
         handler.setFormatter(formatter)
         logger.addHandler(handler)
@@ -67,7 +186,7 @@ def return_logfile(filename):
     "/var/log/" the log file will be in your working directory
     Check for ROOT user if not log to working directory
     """
-    if os.path.isfile(filename):
+    if os.path.isfile(filename) or os.path.isabs(filename):
         return filename
     else:
         user = os.getuid()
@@ -75,27 +194,30 @@ def return_logfile(filename):
         if not user == 0:
             logfile = logname
         else:
-            if os.path.isdir('/var/log'):
-                log_loc = '/var/log'
-            else:
-                try:
+            log_loc = '/var/log'
+            try:
+                if not os.path.isdir(log_loc):
                     os.mkdir('%s' % log_loc)
-                    logfile = '%s/%s' % (log_loc, logname)
-                except Exception:
-                    logfile = '%s' % logname
+                logfile = '%s/%s' % (log_loc, logname)
+            except Exception:
+                logfile = '%s' % logname
         return logfile
 
 
-def load_in(log_file=None, log_level='info', output=None):
+def load_in(log_file=None, log_level='info', output=None, background=False):
     """
     Load in the log handler. If output is not None, systen will use the default
-    Log facility.
+    Log facility. If "background" is True the log is written on a thread of
+    its own.
     """
     if not output:
         if log_file:
             _log_file = return_logfile(filename=log_file)
-            log = Logging(log_level=log_level, log_file=_log_file)
+            log = Logging(log_level=log_level,
+                          log_file=_log_file,
+                          background=background)
             output = log.logger_setup()
         else:
-            output = Logging(log_level=log_level).logger_setup()
+            output = Logging(log_level=log_level,
+                             background=background).logger_setup()
     return output
@@ -0,0 +1,216 @@
+# ==============================================================================
+# Copyright [2013] [Kevin Carter]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import json
+
+# Local Imports
+from bookofnova import jsonstream
+
+
+# Strings that are the same for many items, IE a status or a flavor ID, are
+# kept here so that every item shares one copy. Each field has its own table
+# of at most "MAX_SHARED" strings, once a table is full new strings of that
+# field are not shared, so a process that runs for a long time does not keep
+# every string it has seen. "intern()" can not be used, JSON strings are
+# unicode.
+MAX_SHARED = 1024
+_STRINGS = {}
+
+
+def shared(value, field=None):
+    """
+    Return the shared copy of the string "value" of "field".
+    """
+    if value is None:
+        return None
+    table = _STRINGS.setdefault(field, {})
+    found = table.get(value)
+    if found is not None:
+        return found
+    if len(table) < MAX_SHARED:
+        table[value] = value
+    return value
+
+
+def _lookup(data, path):
+    """
+    Return the value at "path", a tuple of keys, in "data" or None. The image
+    of a server that was booted from a volume is "" and not {"id": ...}.
+    """
+    for key in path:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+def _lazy(name, doc):
+    """
+    Return a property for a section that is kept as the raw JSON text when
+    the item was streamed, the section is parsed the first time it is used.
+    """
+    def _get(self):
+        value = getattr(self, name)
+        if isinstance(value, str):
+            value = json.loads(value)
+            setattr(self, name, value)
+        return value
+    return property(_get, doc=doc)
+
+
+class Model(object):
+    __slots__ = ()
+
+    # (path in the JSON, attribute, shared) of the fields that are kept, only
+    # fields that have few values, IE a status, are shared
+    FIELDS = ()
+
+    # (key in the JSON, attribute) of the sections that are parsed when used
+    LAZY = ()
+
+    # The key the item is wrapped in, IE {"keypair": {...}}
+    WRAPPER = None
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Build the model from an item of a JSON response.
+        """
+        if cls.WRAPPER is not None:
+            data = data.get(cls.WRAPPER, data)
+        model = cls.__new__(cls)
+        for path, name, is_shared in cls.FIELDS:
+            value = _lookup(data, path)
+            if is_shared:
+                value = shared(value, name)
+            setattr(model, name, value)
+        for key, name in cls.LAZY:
+            setattr(model, name, data.get(key))
+        return model
+
+    @classmethod
+    def projection(cls, *names):
+        """
+        Return the "jsonstream" projection tree that parses only the fields
+        of the model, and the dotted field "names", from a streamed list.
+        The lazy sections are kept as raw JSON text.
+        """
+        prefix = []
+        if cls.WRAPPER is not None:
+            prefix.append(cls.WRAPPER)
+        tree = jsonstream.projection(
+            ['.'.join(prefix + list(path)) for path, _, _ in cls.FIELDS] +
+            list(names)
+        )
+        branch = tree
+        for key in prefix:
+            branch = branch[key]
+        for key, _ in cls.LAZY:
+            branch[key] = jsonstream.RAW
+        return tree
+
+    def as_dict(self):
+        """
+        Return the attributes of the model as a dictionary.
+        """
+        data = dict((name, getattr(self, name))
+                    for _, name, _ in self.FIELDS)
+        for _, name in self.LAZY:
+            data[name.lstrip('_')] = getattr(self, name.lstrip('_'))
+        return data
+
+    def __repr__(self):
+        return '<%s %s>' % (self.__class__.__name__,
+                            getattr(self, self.FIELDS[0][1]))
+
+
+class Server(Model):
+    __slots__ = ('id', 'name', 'status', 'task_state', 'flavor_id',
+                 'image_id', 'tenant_id', 'user_id', 'host_id', 'key_name',
+                 'access_ipv4', 'access_ipv6', 'progress', 'created',
+                 'updated', '_metadata', '_addresses')
+
+    FIELDS = ((('id',), 'id', False),
+              (('name',), 'name', False),
+              (('status',), 'status', True),
+              (('OS-EXT-STS:task_state',), 'task_state', True),
+              (('flavor', 'id'), 'flavor_id', True),
+              (('image', 'id'), 'image_id', True),
+              (('tenant_id',), 'tenant_id', True),
+              (('user_id',), 'user_id', True),
+              (('hostId',), 'host_id', False),
+              (('key_name',), 'key_name', True),
+              (('accessIPv4',), 'access_ipv4', False),
+              (('accessIPv6',), 'access_ipv6', False),
+              (('progress',), 'progress', False),
+              (('created',), 'created', False),
+              (('updated',), 'updated', False))
+
+    LAZY = (('metadata', '_metadata'),
+            ('addresses', '_addresses'))
+
+    metadata = _lazy('_metadata', 'The metadata of the server.')
+    addresses = _lazy('_addresses', 'The addresses of the server by network.')
+
+
+class Flavor(Model):
+    __slots__ = ('id', 'name', 'ram', 'vcpus', 'disk', 'ephemeral', 'swap',
+                 'rxtx_factor')
+
+    FIELDS = ((('id',), 'id', True),
+              (('name',), 'name', True),
+              (('ram',), 'ram', False),
+              (('vcpus',), 'vcpus', False),
+              (('disk',), 'disk', False),
+              (('OS-FLV-EXT-DATA:ephemeral',), 'ephemeral', False),
+              (('swap',), 'swap', False),
+              (('rxtx_factor',), 'rxtx_factor', False))
+
+
+class Image(Model):
+    __slots__ = ('id', 'name', 'status', 'server_id', 'min_disk', 'min_ram',
+                 'progress', 'created', 'updated', '_metadata')
+
+    FIELDS = ((('id',), 'id', False),
+              (('name',), 'name', False),
+              (('status',), 'status', True),
+              (('server', 'id'), 'server_id', False),
+              (('minDisk',), 'min_disk', False),
+              (('minRam',), 'min_ram', False),
+              (('progress',), 'progress', False),
+              (('created',), 'created', False),
+              (('updated',), 'updated', False))
+
+    LAZY = (('metadata', '_metadata'),)
+
+    metadata = _lazy('_metadata', 'The metadata of the image.')
+
+
+class KeyPair(Model):
+    __slots__ = ('name', 'fingerprint', 'public_key')
+
+    FIELDS = ((('name',), 'name', False),
+              (('fingerprint',), 'fingerprint', False),
+              (('public_key',), 'public_key', False))
+
+    WRAPPER = 'keypair'
+
+
+class Network(Model):
+    __slots__ = ('id', 'label', 'cidr')
+
+    FIELDS = ((('id',), 'id', True),
+              (('label',), 'label', True),
+              (('cidr',), 'cidr', True))
@@ -0,0 +1,167 @@
+# ==============================================================================
+# Copyright [2013] [Kevin Carter]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import base64
+import json
+import os
+import threading
+
+
+# The default Nova quotas for injected files
+DEFAULT_LIMITS = {'max_files': 5,
+                  'max_path': 255,
+                  'max_content': 10240}
+
+# Read files in blocks that are a multiple of 3 so each block encodes on its own
+READ_SIZE = 3 * 1024 * 64
+
+
+class LimitExceeded(Exception):
+    pass
+
+
+class Body(object):
+    def __init__(self, pieces, length=None, server=None):
+        """
+        A request body made of many strings. The strings are sent one after
+        the other when the request is made, so large pieces, like encoded
+        files that are shared between many bodies, are never copied into one
+        big string. "str()" will still give the whole body. "server" is the
+        name, flavor, image and metadata of a boot body, see
+        "computelib.BootBody".
+        """
+        self.pieces = pieces
+        self.server = server
+        if length is None:
+            length = sum(len(piece) for piece in pieces)
+        self.length = length
+        self._index = 0
+        self._offset = 0
+
+    def copy(self):
+        """
+        Return a new Body, read from the start, that shares our pieces. Each
+        request sends its own copy so one Body can be sent many times, and by
+        many threads at once.
+        """
+        return Body(self.pieces, length=self.length)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.length
+        data = []
+        while size > 0 and self._index < len(self.pieces):
+            piece = self.pieces[self._index]
+            chunk = piece[self._offset:self._offset + size]
+            data.append(chunk)
+            size -= len(chunk)
+            self._offset += len(chunk)
+            if self._offset >= len(piece):
+                self._index += 1
+                self._offset = 0
+        return ''.join(data)
+
+    def __len__(self):
+        return self.length
+
+    def __str__(self):
+        return ''.join(self.pieces)
+
+
+class PersonalityCache(object):
+    def __init__(self, limits=None, max_entries=256):
+        """
+        Keep files that are injected on boot encoded and ready to send. Files
+        are found by their path, modification time and size so a file that
+        changes is encoded again. "limits" overrides the "DEFAULT_LIMITS" for
+        the number of files, the length of the path and the size of a file.
+        """
+        self.limits = dict(DEFAULT_LIMITS)
+        if limits:
+            self.limits.update(limits)
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.encoded = {}
+        self.order = []
+
+    def _encode(self, path):
+        """
+        Return the contents of the file at "path" as a quoted base64 string
+        that can be put in a JSON document as it is.
+        """
+        pieces = []
+        with open(path, 'rb') as enc_src:
+            while True:
+                chunk = enc_src.read(READ_SIZE)
+                if not chunk:
+                    break
+                pieces.append(base64.b64encode(chunk))
+        return '"%s"' % ''.join(pieces)
+
+    def contents(self, path):
+        """
+        Return the encoded contents of the file at "path", encoding the file
+        only if it is not in the cache or has changed.
+        """
+        f_stat = os.stat(path)
+        if f_stat.st_size > self.limits['max_content']:
+            raise LimitExceeded('"%s" is %s bytes, the most that can be'
+                                ' injected is %s bytes'
+                                % (path, f_stat.st_size,
+                                   self.limits['max_content']))
+        key = (path, f_stat.st_mtime, f_stat.st_size)
+        with self.lock:
+            if key in self.encoded:
+                return self.encoded[key]
+
+        encoded = self._encode(path)
+        with self.lock:
+            if key not in self.encoded:
+                if len(self.order) >= self.max_entries:
+                    self.encoded.pop(self.order.pop(0), None)
+                self.order.append(key)
+                self.encoded[key] = encoded
+        return encoded
+
+    def pieces(self, inj_files, errors=None):
+        """
+        Return the JSON for the "personality" of a server as a list of
+        strings. "inj_files" is a list of "destination=source" strings. A
+        source that is not a file is left out, or added to "errors" if it is a
+        list.
+        """
+        if len(inj_files) > self.limits['max_files']:
+            raise LimitExceeded('%s files were given, the most that can be'
+                                ' injected is %s'
+                                % (len(inj_files), self.limits['max_files']))
+        pieces = ['[']
+        for i_f in inj_files:
+            dst, src = i_f.split('=', 1)
+            if len(dst) > self.limits['max_path']:
+                raise LimitExceeded('The path "%s" is longer than %s'
+                                    % (dst, self.limits['max_path']))
+            loc_src = os.path.realpath(src)
+            if not os.path.isfile(loc_src):
+                if errors is not None:
+                    errors.append('The file "%s" was not found' % src)
+                continue
+            if len(pieces) > 1:
+                pieces.append(', ')
+            pieces.append('{"path": %s, "contents": '
+                          % json.dumps(dst.encode('utf-8')))
+            pieces.append(self.contents(loc_src))
+            pieces.append('}')
+        pieces.append(']')
+        return pieces
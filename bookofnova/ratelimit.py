@@ -0,0 +1,151 @@
+# ==============================================================================
+# Copyright [2013] [Kevin Carter]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import email.utils
+import re
+import threading
+import time
+
+
+# Seconds in each of the units used by the Nova "/limits" API
+UNITS = {'SECOND': 1,
+         'MINUTE': 60,
+         'HOUR': 3600,
+         'DAY': 86400}
+
+
+def retry_after(value):
+    """
+    Return the number of seconds to wait from a "Retry-After" header, which
+    is either a number of seconds or a HTTP date. None is returned if the
+    header could not be understood.
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        date = email.utils.parsedate_tz(value)
+        if date is None:
+            return None
+        return max(email.utils.mktime_tz(date) - time.time(), 0)
+
+
+class TokenBucket(object):
+    def __init__(self, value, unit, remaining=None):
+        """
+        Allow "value" requests per "unit" of time. The bucket starts with
+        "remaining" tokens, or full, and is refilled at an even rate.
+        """
+        self.capacity = float(value)
+        self.rate = self.capacity / UNITS.get(unit.upper(), 60)
+        if remaining is None:
+            remaining = value
+        self.tokens = min(float(remaining), self.capacity)
+        self.updated = time.time()
+        self.blocked_until = 0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        """
+        Return the seconds until a request can be made, 0 means right now.
+        """
+        self._refill(now)
+        wait = self.blocked_until - now
+        if self.tokens < 1 and self.rate > 0:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return max(wait, 0)
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, seconds, now):
+        """
+        Stop all requests for "seconds", the API told us we are over.
+        """
+        self._refill(now)
+        self.tokens = 0
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+
+class RateLimiter(object):
+    def __init__(self, rates=None):
+        """
+        Delay requests so that they stay under the rate limits of the account.
+        "rates" is the "rate" list from the Nova "/limits" API, there is one
+        token bucket for each verb and URI regex. A limit of 0 never refills
+        so it is left to the API, which will tell us when to try again.
+        "delays" and "waited" are the number of requests that were delayed
+        and the total seconds spent waiting.
+        """
+        self.lock = threading.Lock()
+        self.buckets = []
+        self.delays = 0
+        self.waited = 0.0
+        for rate in rates or []:
+            regex = re.compile(rate.get('regex') or '.*')
+            for limit in rate.get('limit', []):
+                if not limit['value'] > 0:
+                    continue
+                bucket = TokenBucket(value=limit['value'],
+                                     unit=limit.get('unit', 'MINUTE'),
+                                     remaining=limit.get('remaining'))
+                self.buckets.append((limit['verb'].upper(), regex, bucket))
+
+    def _matching(self, method, path):
+        return [bucket for verb, regex, bucket in self.buckets
+                if verb == method and regex.search(path)]
+
+    def acquire(self, method, path):
+        """
+        Wait until a "method" request for "path" can be made without going
+        over a limit and then use a token from each limit that it matches.
+        Returns the seconds that we waited.
+        """
+        buckets = self._matching(method.upper(), path)
+        if not buckets:
+            return 0
+        waited = 0
+        while True:
+            with self.lock:
+                now = time.time()
+                delay = max(bucket.delay(now) for bucket in buckets)
+                if delay <= 0:
+                    for bucket in buckets:
+                        bucket.take(now)
+                    if waited:
+                        self.delays += 1
+                        self.waited += waited
+                    return waited
+            time.sleep(delay)
+            waited += delay
+
+    def block(self, method, path, seconds):
+        """
+        Stop requests that match "method" and "path" for "seconds". Returns
+        False if there is no limit for the request, in which case the caller
+        has to do the waiting.
+        """
+        with self.lock:
+            now = time.time()
+            buckets = self._matching(method.upper(), path)
+            for bucket in buckets:
+                bucket.block(seconds, now)
+            return bool(buckets)
@@ -0,0 +1,144 @@
+# ==============================================================================
+# Copyright [2013] [Kevin Carter]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import threading
+import time
+
+
+# Seconds that each type of reference data is kept before it is loaded again
+DEFAULT_TTLS = {'flavors': 3600,
+                'images': 300,
+                'keypairs': 300,
+                'networks': 300}
+
+# How to find the ID and the name of an item for each type of reference data
+KEYS = {'flavors': (lambda item: item['id'], lambda item: item['name']),
+        'images': (lambda item: item['id'], lambda item: item['name']),
+        'keypairs': (lambda item: item['keypair']['name'],
+                     lambda item: item['keypair']['name']),
+        'networks': (lambda item: item['id'], lambda item: item['label'])}
+
+
+class UnknownResource(Exception):
+    pass
+
+
+def _key(key):
+    """
+    IDs from the API are strings, allow a flavor of 2 to be found as "2".
+    """
+    if isinstance(key, basestring):
+        return key
+    return str(key)
+
+
+class Reference(object):
+    def __init__(self, items, id_key, name_key):
+        """
+        One load of a type of reference data with the items indexed by their
+        ID and their name.
+        """
+        self.loaded = time.time()
+        self.items = items
+        self.by_id = {}
+        self.by_name = {}
+        for item in items:
+            self.by_id[_key(id_key(item))] = item
+            name = name_key(item)
+            if name is not None:
+                self.by_name[name] = item
+
+
+class ReferenceCache(object):
+    def __init__(self, loaders, ttls=None):
+        """
+        Keep reference data, IE flavors, images, key pairs and networks, so
+        that it can be looked up without asking the API every time.
+        "loaders" is a dictionary of resource name to a callable that returns
+        the list of items for that resource. "ttls" is the number of seconds
+        to keep each resource, either a dictionary of resource name to seconds
+        or one number used for all resources.
+        """
+        self.loaders = loaders
+        self.ttls = dict(DEFAULT_TTLS)
+        if isinstance(ttls, dict):
+            self.ttls.update(ttls)
+        elif ttls is not None:
+            self.ttls = dict((resource, ttls) for resource in self.ttls)
+        self.lock = threading.Lock()
+        self.data = {}
+
+    def _get(self, resource):
+        """
+        Return the Reference for "resource", loading it if we do not have it
+        or if it has expired. Only one thread will load a resource at a time.
+        """
+        if resource not in self.loaders:
+            raise UnknownResource('"%s" is not one of "%s"'
+                                  % (resource, self.loaders.keys()))
+        with self.lock:
+            data = self.data.get(resource)
+            ttl = self.ttls.get(resource, 0)
+            if data is None or time.time() - data.loaded > ttl:
+                id_key, name_key = KEYS[resource]
+                data = Reference(items=self.loaders[resource](),
+                                 id_key=id_key,
+                                 name_key=name_key)
+                self.data[resource] = data
+            return data
+
+    def snapshot(self, resource):
+        """
+        Return the current Reference for "resource". The Reference does not
+        change, which makes it useful when many lookups should all see the
+        same data.
+        """
+        return self._get(resource)
+
+    def items(self, resource):
+        """
+        Return all of the items for "resource".
+        """
+        return self._get(resource).items
+
+    def by_id(self, resource, key):
+        """
+        Return the item of "resource" with the ID "key" or None.
+        """
+        return self._get(resource).by_id.get(_key(key))
+
+    def by_name(self, resource, name):
+        """
+        Return the item of "resource" named "name" or None.
+        """
+        return self._get(resource).by_name.get(name)
+
+    def get(self, resource, key):
+        """
+        Return the item of "resource" that has "key" as its ID or its name.
+        """
+        data = self._get(resource)
+        return data.by_id.get(_key(key)) or data.by_name.get(key)
+
+    def invalidate(self, resource=None):
+        """
+        Forget "resource", or everything if no resource is given, so that it
+        is loaded again the next time it is used.
+        """
+        with self.lock:
+            if resource is None:
+                self.data = {}
+            else:
+                self.data.pop(resource, None)
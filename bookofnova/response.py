@@ -0,0 +1,136 @@
+# ==============================================================================
+# Copyright [2013] [Kevin Carter]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+# The keys that a call used to write to its arguments and the attribute of a
+# Response that now holds each of them
+KEYS = {'nova_status': 'status',
+        'nova_reason': 'reason',
+        'nova_resp': 'body',
+        'nova_headers': 'headers',
+        'nova_elapsed': 'elapsed',
+        'nova_attempts': 'attempts',
+        'nova_backoff': 'backoff',
+        'nova_trace': 'trace',
+        'nova_transfer': 'transfer',
+        'nova_cached': 'cached'}
+
+
+class Response(object):
+    __slots__ = ('status', 'reason', 'headers', 'body', 'elapsed', 'attempts',
+                 'backoff', 'trace', 'transfer', 'cached', 'args')
+
+    def __init__(self, status, reason, headers=None, body=None, elapsed=None,
+                 attempts=1, backoff=0.0, trace=None, transfer=None,
+                 cached=False, args=None):
+        """
+        The result of one call to the API. A Response can not be changed once
+        it is made, use "replace" to get a changed copy. "headers" are the
+        headers of the response, "elapsed" is the seconds the call took and
+        "trace" is the "tracing.Span" of the call if it was traced.
+        "transfer" has the bytes sent and received, before and after
+        compression. "cached" is True if the body came from the HTTP cache
+        because the API told us that it had not changed. "args" are the
+        arguments that the call was made with.
+
+        A Response can still be read like the dictionary that calls used to
+        return, IE "action['nova_resp']" is "action.body" and
+        "action['os_region']" is the region the call was made in.
+        """
+        for name, value in (('status', status),
+                            ('reason', reason),
+                            ('headers', headers or {}),
+                            ('body', body),
+                            ('elapsed', elapsed),
+                            ('attempts', attempts),
+                            ('backoff', backoff),
+                            ('trace', trace),
+                            ('transfer', transfer),
+                            ('cached', cached),
+                            ('args', args or {})):
+            object.__setattr__(self, name, value)
+
+    @classmethod
+    def from_args(cls, args, headers=None):
+        """
+        Make a Response from the "nova_" keys that a call wrote to "args",
+        the keys are taken out of "args" which is kept as the arguments of
+        the call.
+        """
+        return cls(status=args.pop('nova_status', None),
+                   reason=args.pop('nova_reason', None),
+                   headers=headers,
+                   body=args.pop('nova_resp', None),
+                   elapsed=args.pop('nova_elapsed', None),
+                   attempts=args.pop('nova_attempts', 1),
+                   backoff=args.pop('nova_backoff', 0.0),
+                   trace=args.pop('nova_trace', None),
+                   transfer=args.pop('nova_transfer', None),
+                   cached=args.pop('nova_cached', False),
+                   args=args)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('A Response can not be changed, use "replace"')
+
+    def __delattr__(self, name):
+        raise AttributeError('A Response can not be changed, use "replace"')
+
+    def replace(self, **changes):
+        """
+        Return a copy of the Response with "changes" made to it, IE
+        "action.replace(status=False)".
+        """
+        values = dict((name, getattr(self, name)) for name in self.__slots__)
+        values.update(changes)
+        return Response(**values)
+
+    def failed(self):
+        """
+        Return True if the API did not give us a good response.
+        """
+        return not self.status or self.status >= 300
+
+    def __getitem__(self, key):
+        if key in KEYS:
+            return getattr(self, KEYS[key])
+        return self.args[key]
+
+    def __setitem__(self, key, value):
+        raise TypeError('A Response can not be changed, use "replace"')
+
+    def __contains__(self, key):
+        return key in KEYS or key in self.args
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return list(self.args) + list(KEYS)
+
+    def as_dict(self):
+        """
+        Return the Response in the shape that calls used to return, the
+        arguments of the call with the "nova_" keys added.
+        """
+        data = dict(self.args)
+        for key, name in KEYS.items():
+            data[key] = getattr(self, name)
+        return data
+
+    def __repr__(self):
+        return '<Response %s %s>' % (self.status, self.reason)
@@ -0,0 +1,90 @@
+# ==============================================================================
+# Copyright [2013] [Kevin Carter]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import httplib
+import random
+import socket
+
+
+# Methods that can be sent again without changing the result
+IDEMPOTENT = ('GET', 'HEAD', 'PUT', 'DELETE')
+
+
+class RetryPolicy(object):
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=30,
+                 jitter=1.0, statuses=(500, 502, 503, 504),
+                 exceptions=(socket.error, httplib.HTTPException),
+                 retry_post=False):
+        """
+        How to retry a request that failed for a reason that is likely to
+        pass, IE a 503 or a connection reset.
+
+        "max_attempts" is the most times a request is made, including the
+        first. The wait before attempt N is "base_delay * 2 ** (N - 2)",
+        capped at "max_delay". "jitter" is the part of that wait, between 0
+        and 1, that is random, so many clients do not all retry at once.
+        "statuses" and "exceptions" are the response codes and errors that
+        are retried.
+
+        GET, HEAD, PUT and DELETE are always retried. A POST, IE booting a
+        server, could be done twice so it is only retried if "retry_post" is
+        True.
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.statuses = tuple(statuses)
+        self.exceptions = tuple(exceptions)
+        self.retry_post = retry_post
+
+    def allows(self, method, attempts, status=None, exc=None,
+               idempotent=False):
+        """
+        Return True if a "method" request that has been made "attempts" times
+        should be made again after getting "status" or raising "exc". A POST
+        that is safe to make twice, IE getting a token, can set "idempotent".
+        """
+        if attempts >= self.max_attempts:
+            return False
+        elif (method.upper() not in IDEMPOTENT and not idempotent and
+              not self.retry_post):
+            return False
+        elif exc is not None:
+            return isinstance(exc, self.exceptions)
+        return status in self.statuses
+
+    def delay(self, attempts):
+        """
+        Return the seconds to wait before the next attempt.
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return delay - delay * self.jitter * random.random()
+
+
+def from_args(m_args):
+    """
+    Return the RetryPolicy set as "m_args['retry']". The value can be a
+    RetryPolicy or a dictionary of the arguments for one. If it is not set
+    requests are only made once.
+    """
+    policy = m_args.get('retry')
+    if isinstance(policy, RetryPolicy):
+        return policy
+    elif isinstance(policy, dict):
+        return RetryPolicy(**policy)
+    elif policy:
+        return RetryPolicy()
+    return RetryPolicy(max_attempts=1)
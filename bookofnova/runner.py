@@ -0,0 +1,466 @@
+# ==============================================================================
+# Copyright [2013] [Kevin Carter]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+Run a JSON manifest of operations in one authenticated session :
+
+    bookofnova-run manifest.json --auth credentials.json --concurrency 20
+
+A manifest looks like :
+
+    {"concurrency": 20,
+     "m_args": {"os_region": "ORD"},
+     "steps": [
+        {"id": "web", "op": "boot",
+         "args": {"name": "web", "imageRef": "...", "flavorRef": "2"}},
+        {"id": "web-up", "op": "wait",
+         "args": {"server_ids": ["$web.server.id"]}},
+        {"id": "snap", "op": "image_create", "after": ["web-up"],
+         "args": {"server_id": "$web.server.id", "name": "web-snap"}}]}
+
+A string argument that starts with "$" is the result of another step,
+"$web.server.id" is the "id" of the "server" in the result of the step "web"
+and "$servers.*.id" is the "id" of every item of a list. A step runs once the
+steps it uses, and those named in "after", have finished. If one of them
+failed the step is skipped. Steps that do not depend on each other are run at
+the same time, up to "concurrency" at once.
+
+A JSON line is written for every step as it finishes, with its "status" of
+"ok", "failed" or "skipped", when it "started", the "seconds" it took and its
+"result" or "error". The last line is the summary of the run.
+"""
+import Queue
+import json
+import optparse
+import sys
+import time
+import traceback
+
+# Local Imports
+from bookofnova import computelib, models, response, workers
+
+
+# The "m_args" that are used unless the manifest or "--auth" set them
+M_ARGS = {'os_user': None,
+          'os_apikey': None,
+          'os_auth_url': None,
+          'os_rax_auth': None,
+          'os_verbose': None,
+          'os_password': None,
+          'os_tenant': None,
+          'os_region': None,
+          'os_version': 'v2.0'}
+
+
+class ManifestError(Exception):
+    pass
+
+
+def _checked(action):
+    """
+    Return the body of "action" or raise RequestFailed if it failed.
+    """
+    if computelib._failed(action):
+        raise computelib.RequestFailed('The API returned STATUS %s %s'
+                                       % (action['nova_status'],
+                                          action['nova_reason']),
+                                       action=action)
+    return action['nova_resp'] or None
+
+
+def _op_boot(nova, args):
+    return _checked(nova.booter(nova.builder(args)))
+
+
+def _op_reboot(nova, args):
+    return _checked(nova.re_booter(args['server_id'],
+                                   hard_reboot=args.get('hard', True)))
+
+
+def _op_resize(nova, args):
+    return _checked(nova.re_sizer(args['server_id'], args['flavor']))
+
+
+def _op_confirm_resize(nova, args):
+    return _checked(nova.confirm_revert_resize(args['server_id']))
+
+
+def _op_revert_resize(nova, args):
+    return _checked(nova.confirm_revert_resize(args['server_id'],
+                                               confirm=False))
+
+
+def _op_image_create(nova, args):
+    action = nova.image_create(args['server_id'],
+                               img_name=args['name'],
+                               meta_data=args.get('metadata'))
+    _checked(action)
+    location = action.headers.get('location')
+    if not location:
+        return None
+    return {'image_id': location.rstrip('/').rsplit('/', 1)[-1],
+            'location': location}
+
+
+def _op_delete(nova, args):
+    action = nova.server_nuker(args['server_id'])
+    if action['nova_status'] == 404:
+        return None
+    return _checked(action)
+
+
+def _op_delete_many(nova, args):
+    summary = nova.nuke_many(args['server_ids'],
+                             concurrency=args.get('concurrency', 10),
+                             wait=args.get('wait', True),
+                             timeout=args.get('timeout', 600))
+    if summary['failed'] or summary['timed_out']:
+        raise computelib.RequestFailed('%s servers failed to delete and %s'
+                                       ' timed out'
+                                       % (len(summary['failed']),
+                                          len(summary['timed_out'])),
+                                       action=summary)
+    return summary
+
+
+def _op_image_delete(nova, args):
+    return _checked(nova.image_nuker(args['image_id']))
+
+
+def _op_server_info(nova, args):
+    return _checked(nova.server_info(args['server_id']))
+
+
+LISTS = {'servers': 'iter_servers_detail',
+         'images': 'iter_images_detail',
+         'flavors': 'iter_flavors_detail',
+         'key_pairs': 'iter_key_pairs'}
+
+
+def _op_list(nova, args):
+    args = dict(args)
+    collection = args.pop('collection', 'servers')
+    if collection not in LISTS:
+        raise ManifestError('Can not list "%s", the lists are "%s"'
+                            % (collection, '", "'.join(sorted(LISTS))))
+    return list(getattr(nova, LISTS[collection])(**args))
+
+
+def _op_wait(nova, args):
+    status = args.get('status', 'ACTIVE').upper()
+    servers = list(nova.wait_for(args['server_ids'],
+                                 target_status=status,
+                                 timeout=args.get('timeout', 1800),
+                                 interval=args.get('interval', 5)))
+    done = [server for server in servers
+            if server.get('status', '').upper() == status]
+    if len(done) != len(set(args['server_ids'])):
+        raise computelib.RequestFailed('%s of %s servers are %s'
+                                       % (len(done),
+                                          len(set(args['server_ids'])),
+                                          status),
+                                       action=servers)
+    return servers
+
+
+OPERATIONS = {'boot': _op_boot,
+              'reboot': _op_reboot,
+              'resize': _op_resize,
+              'confirm_resize': _op_confirm_resize,
+              'revert_resize': _op_revert_resize,
+              'image_create': _op_image_create,
+              'delete': _op_delete,
+              'delete_many': _op_delete_many,
+              'image_delete': _op_image_delete,
+              'server_info': _op_server_info,
+              'list': _op_list,
+              'wait': _op_wait}
+
+
+def _jsonable(value):
+    """
+    Turn the values that JSON does not know into something that it does.
+    """
+    if isinstance(value, response.Response):
+        return {'status': value.status,
+                'reason': value.reason,
+                'body': value.body}
+    elif isinstance(value, models.Model):
+        return value.as_dict()
+    elif isinstance(value, (set, frozenset)):
+        return sorted(value)
+    return str(value)
+
+
+def references(value):
+    """
+    Return the IDs of the steps whose results are used in "value".
+    """
+    if isinstance(value, basestring):
+        if value.startswith('$') and not value.startswith('$$'):
+            return set([value[1:].split('.', 1)[0]])
+        return set()
+    elif isinstance(value, dict):
+        value = value.values()
+    elif not isinstance(value, list):
+        return set()
+    found = set()
+    for item in value:
+        found.update(references(item))
+    return found
+
+
+def _lookup(value, parts, reference):
+    for index, part in enumerate(parts):
+        if part == '*':
+            return [_lookup(item, parts[index + 1:], reference)
+                    for item in value or []]
+        try:
+            if isinstance(value, list):
+                value = value[int(part)]
+            else:
+                value = value[part]
+        except (KeyError, IndexError, ValueError, TypeError):
+            raise ManifestError('"%s" was not found in the result'
+                                % reference)
+    return value
+
+
+def resolve(value, results):
+    """
+    Return "value" with every reference to a step replaced by the result of
+    that step. "$$" at the start of a string is a plain "$".
+    """
+    if isinstance(value, basestring):
+        if value.startswith('$$'):
+            return value[1:]
+        elif value.startswith('$'):
+            parts = value[1:].split('.')
+            return _lookup(results[parts[0]]['result'], parts[1:], value)
+        return value
+    elif isinstance(value, dict):
+        return dict((key, resolve(item, results))
+                    for key, item in value.items())
+    elif isinstance(value, list):
+        return [resolve(item, results) for item in value]
+    return value
+
+
+def check_steps(steps):
+    """
+    Make sure that every step has a unique ID and a known operation, that
+    the steps it depends on exist and that no steps depend on each other.
+    Returns a dictionary of step ID to the IDs of the steps it depends on.
+    """
+    depends = {}
+    for number, step in enumerate(steps):
+        step_id = step.get('id')
+        if step_id is None:
+            step_id = step['id'] = str(number)
+        if step_id in depends:
+            raise ManifestError('There is more than one step "%s"' % step_id)
+        if step.get('op') not in OPERATIONS:
+            raise ManifestError('The step "%s" has the operation "%s", the'
+                                ' operations are "%s"'
+                                % (step_id, step.get('op'),
+                                   '", "'.join(sorted(OPERATIONS))))
+        depends[step_id] = (set(step.get('after') or []) |
+                            references(step.get('args') or {}))
+
+    for step_id, needs in depends.items():
+        for need in needs:
+            if need not in depends:
+                raise ManifestError('The step "%s" depends on "%s" which is'
+                                    ' not in the manifest' % (step_id, need))
+
+    # Take away the steps that depend on nothing left, anything that is
+    # left at the end is in a loop
+    remaining = dict((step_id, set(needs))
+                     for step_id, needs in depends.items())
+    while remaining:
+        ready = [step_id for step_id, needs in remaining.items()
+                 if not needs]
+        if not ready:
+            raise ManifestError('The steps "%s" depend on each other'
+                                % '", "'.join(sorted(remaining)))
+        for step_id in ready:
+            del remaining[step_id]
+        for needs in remaining.values():
+            needs.difference_update(ready)
+    return depends
+
+
+class Runner(object):
+    def __init__(self, nova, steps, concurrency=10, report=None):
+        """
+        Run the "steps" of a manifest using the authenticated NovaCommands
+        "nova". "report" is called with the record of every step as it
+        finishes.
+        """
+        self.nova = nova
+        self.steps = steps
+        self.concurrency = concurrency
+        self.report = report
+        self.depends = check_steps(steps)
+
+    def _run_step(self, step, results):
+        record = {'id': step['id'],
+                  'op': step['op'],
+                  'started': time.time()}
+        try:
+            args = resolve(step.get('args') or {}, results)
+            record['result'] = OPERATIONS[step['op']](self.nova, args)
+            record['status'] = 'ok'
+        except Exception, exp:
+            self.nova.output.debug(traceback.format_exc())
+            record['status'] = 'failed'
+            record['error'] = str(exp)
+            record['result'] = getattr(exp, 'action', None)
+        record['seconds'] = time.time() - record['started']
+        return record
+
+    def _finish(self, record, results):
+        results[record['id']] = record
+        if self.report is not None:
+            self.report(record)
+
+    def run(self):
+        """
+        Run every step and return the records of the steps in the order
+        that they finished.
+        """
+        pending = dict((step['id'], step) for step in self.steps)
+        results = {}
+        records = []
+        finished = Queue.Queue()
+        pool = workers.WorkerPool(workers=self.concurrency)
+        running = 0
+        try:
+            while pending or running:
+                started = True
+                while started:
+                    started = False
+                    for step_id, step in pending.items():
+                        needs = self.depends[step_id]
+                        if not needs.issubset(results):
+                            continue
+                        del pending[step_id]
+                        started = True
+                        failed = [need for need in needs
+                                  if results[need]['status'] != 'ok']
+                        if failed:
+                            record = {'id': step_id,
+                                      'op': step['op'],
+                                      'status': 'skipped',
+                                      'started': time.time(),
+                                      'seconds': 0,
+                                      'error': 'The steps "%s" did not work'
+                                               % '", "'.join(sorted(failed))}
+                            self._finish(record, results)
+                            records.append(record)
+                            continue
+                        future = pool.submit(self._run_step, step, results)
+                        future.add_done_callback(finished.put)
+                        running += 1
+                if not running:
+                    continue
+                record = finished.get().result()
+                running -= 1
+                self._finish(record, results)
+                records.append(record)
+        finally:
+            pool.shutdown(wait=False)
+        return records
+
+
+def summary(records, seconds):
+    """
+    Return the number of steps with each status and the seconds the run
+    took.
+    """
+    counts = {'ok': 0, 'failed': 0, 'skipped': 0}
+    for record in records:
+        counts[record['status']] += 1
+    return dict(counts, steps=len(records), seconds=seconds)
+
+
+def main(argv=None):
+    parser = optparse.OptionParser(
+        usage='%prog [options] MANIFEST',
+        description='Run a JSON manifest of Nova operations in one'
+                    ' authenticated session.'
+    )
+    parser.add_option('--auth', metavar='FILE',
+                      help='JSON file of the "m_args" used to authenticate,'
+                           ' added to the "m_args" of the manifest')
+    parser.add_option('--concurrency', type='int',
+                      help='Steps run at the same time, overrides the'
+                           ' manifest [10]')
+    parser.add_option('--output', metavar='FILE',
+                      help='Also write every record and the summary to FILE')
+    parser.add_option('--log-level', default='error',
+                      help='Level of the log written to stderr [%default]')
+    parser.add_option('--log-file', metavar='FILE',
+                      help='Write the log to FILE instead')
+    options, arguments = parser.parse_args(argv)
+    if len(arguments) != 1:
+        parser.error('Give one manifest')
+
+    try:
+        with open(arguments[0]) as m_file:
+            manifest = json.load(m_file)
+        concurrency = (options.concurrency or manifest.get('concurrency') or
+                       10)
+        m_args = dict(M_ARGS, pool_size=concurrency)
+        m_args.update(manifest.get('m_args') or {})
+        if options.auth:
+            with open(options.auth) as a_file:
+                m_args.update(json.load(a_file))
+        steps = manifest.get('steps') or []
+        check_steps(steps)
+    except (IOError, ValueError, ManifestError), exp:
+        parser.error(str(exp))
+
+    nova = computelib.NovaCommands(m_args=m_args,
+                                   log_file=options.log_file,
+                                   log_level=options.log_level)
+    started = time.time()
+    try:
+        nova.auth()
+    except Exception, exp:
+        nova.output.debug(traceback.format_exc())
+        sys.stderr.write('Authentication failed : %s\n' % exp)
+        return 2
+
+    def _report(record):
+        sys.stdout.write('%s\n' % json.dumps(record, default=_jsonable))
+        sys.stdout.flush()
+
+    runner = Runner(nova, steps, concurrency=concurrency, report=_report)
+    records = runner.run()
+    done = summary(records, time.time() - started)
+    sys.stdout.write('%s\n' % json.dumps({'summary': done}))
+    if options.output:
+        with open(options.output, 'w') as o_file:
+            json.dump({'summary': done, 'steps': records}, o_file,
+                      default=_jsonable, indent=2)
+    nova.connection.close()
+    if done['failed'] or done['skipped']:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -14,6 +14,9 @@
 # limitations under the License.
 # ==============================================================================
 
+# Local Imports
+from bookofnova import logger
+
 
 class ResultExceptions(object):
     def __init__(self, output):
@@ -32,32 +35,35 @@ class ResultExceptions(object):
         Non-20x status code responses.
         """
         if resp.status == 400 or resp.status == 503:
-            self.output.critical('STATUS %s:\tIt looks like Shits Broken ==> %s'
-                                 % (resp.status, jsonreq))
+            self.output.critical('STATUS %s:\tIt looks like Shits Broken =='
+                                 '> %s', resp.status, logger.Dump(jsonreq))
             return self._get_headers(resp)
         elif resp.status == 401:
             self.output.warn('STATUS %s:\tYou are not Authorized to perform'
                              ' this action. Please check Credentials ==> %s.'
                              ' Also this ERROR could have been caused by an'
-                             ' expired Token.' % (resp.status, jsonreq))
+                             ' expired Token.', resp.status,
+                             logger.Dump(jsonreq))
             return self._get_headers(resp)
         elif resp.status == 409 or resp.status == 404:
-            self.output.warn('STATUS\t%s: URI Not found, likely Gone'
-                             % (resp.status))
+            self.output.warn('STATUS\t%s: URI Not found, likely Gone',
+                             resp.status)
             return self._get_headers(resp)
         elif resp.status == 413:
             d_i = self._get_headers(resp)
             self.output.critical('STATUS %s:\tThe System encountered an API'
-                                 ' limitation : %s' % (resp.status, d_i))
+                                 ' limitation : %s', resp.status, d_i)
             return d_i
         elif resp.status == 302 or resp.status == 500:
             self.output.critical('STATUS %s:\tNOVA-API REDIRECT =>'
                                  ' REQUEST: %s %s %s Make your request using a'
-                                 ' different Protocol. (IE: HTTPS or HTTP)'
-                                 % (resp.status, resp.reason, jsonreq, authurl))
+                                 ' different Protocol. (IE: HTTPS or HTTP)',
+                                 resp.status, resp.reason,
+                                 logger.Dump(jsonreq), authurl)
             return self._get_headers(resp)
         elif resp.status >= 300 <= 600:
             self.output.error('STATUS %s:\tNOVA-API FAILURE =='
-                              ' > REQUEST: %s %s %s'
-                              % (resp.status, resp.reason, jsonreq, authurl))
+                              ' > REQUEST: %s %s %s',
+                              resp.status, resp.reason, logger.Dump(jsonreq),
+                              authurl)
             return self._get_headers(resp)
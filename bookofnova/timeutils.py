@@ -0,0 +1,55 @@
+# ==============================================================================
+# Copyright [2013] [Kevin Carter]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import calendar
+import re
+import time
+
+
+# An ISO 8601 time as the OpenStack APIs give it, with or without fractions
+# of a second and with a "Z" or an offset
+ISO8601 = re.compile(r'(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(?:\.\d+)?'
+                     r'(Z|[+-]\d\d:?\d\d)?$')
+
+
+def parse_iso8601(value):
+    """
+    Return the epoch time of an ISO 8601 time, IE the "expires" of a token
+    "2013-03-24T17:43:12.000-05:00" or the "updated" of a server
+    "2013-03-24T17:43:12Z". None is returned if the time could not be
+    understood.
+    """
+    match = ISO8601.match(value or '')
+    if not match:
+        return None
+    parts = [int(part) for part in match.groups()[:6]]
+    epoch = calendar.timegm(parts)
+    offset = match.group(7)
+    if offset and offset != 'Z':
+        offset = offset.replace(':', '')
+        seconds = int(offset[1:3]) * 3600 + int(offset[3:5]) * 60
+        if offset.startswith('-'):
+            epoch += seconds
+        else:
+            epoch -= seconds
+    return epoch
+
+
+def iso8601(epoch):
+    """
+    Return the epoch time "epoch" as an ISO 8601 time in UTC, IE for a
+    "changes-since" query.
+    """
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(epoch))
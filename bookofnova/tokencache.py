@@ -0,0 +1,126 @@
+# ==============================================================================
+# Copyright [2013] [Kevin Carter]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import time
+import traceback
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Local Imports
+from bookofnova import timeutils
+
+
+# The parsed authentication values that are kept in the cache
+CACHED_KEYS = ('token', 'expires', 'nova_endpoint', 'nova_endpoints',
+               'service_catalog', 'tenantid', 'rackspace_auth')
+
+
+class TokenCache(object):
+    def __init__(self, cache_dir, output, skew=60):
+        """
+        Keep authentication tokens on disk so that they can be shared between
+        processes. Each entry is keyed by the Auth URL, user, tenant and region
+        and holds the token, its expiry and the parsed service catalog values.
+        A token will not be used once it is within "skew" seconds of expiring.
+        """
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.output = output
+        self.skew = skew
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir, 0700)
+
+    def key(self, auth_url, user, tenant, region):
+        """
+        Return the name of the cache entry for a set of credentials.
+        """
+        key = '%s|%s|%s|%s' % (auth_url, user, tenant, region)
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, 'token-%s.json' % key)
+
+    @contextlib.contextmanager
+    def lock(self, key):
+        """
+        Hold an exclusive lock on a cache entry. While one process holds the
+        lock and authenticates the others will wait and then use its token.
+        """
+        if fcntl is None:
+            yield
+            return
+
+        lock_file = open('%s.lock' % self._path(key), 'a')
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            lock_file.close()
+
+    def load(self, key):
+        """
+        Return the cached values for "key" or None if there is no entry or the
+        token has expired.
+        """
+        path = self._path(key)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with open(path) as c_file:
+                data = json.load(c_file)
+        except (IOError, ValueError):
+            self.output.error(traceback.format_exc())
+            return None
+
+        expires = timeutils.parse_iso8601(data.get('expires'))
+        if expires is None or expires - self.skew <= time.time():
+            self.output.debug('Cached token for %s has expired', key)
+            return None
+        return data
+
+    def save(self, key, m_args):
+        """
+        Store the authentication values from "m_args". The entry is written to
+        a temporary file which is then renamed over the old entry so that a
+        reader will never see a partial file.
+        """
+        data = dict((c_key, m_args.get(c_key)) for c_key in CACHED_KEYS)
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.token-')
+        try:
+            with os.fdopen(fd, 'w') as c_file:
+                json.dump(data, c_file)
+                c_file.flush()
+                os.fsync(c_file.fileno())
+            os.rename(temp_path, self._path(key))
+        except (IOError, OSError):
+            self.output.error(traceback.format_exc())
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def invalidate(self, key):
+        """
+        Remove the cache entry for "key".
+        """
+        path = self._path(key)
+        if os.path.isfile(path):
+            os.remove(path)
@@ -0,0 +1,188 @@
+# ==============================================================================
+# Copyright [2013] [Kevin Carter]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import httplib
+import re
+import socket
+import ssl
+import threading
+import time
+
+
+# The phases of a request, in the order that they happen
+PHASES = ('dns', 'connect', 'tls', 'ttfb', 'body', 'decode')
+
+# Parts of a path that are IDs, IE server UUIDs or numeric flavor IDs
+ID_SEGMENT = re.compile(r'^(?:[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-'
+                        r'[0-9a-fA-F]{4}-[0-9a-fA-F]{12}|\d+)$')
+
+
+def template(path):
+    """
+    Return "path" with the query removed and the IDs replaced, IE
+    "/servers/1a2b...-.../action" becomes "/servers/{id}/action", so that the
+    timings of the same kind of request can be grouped together.
+    """
+    segments = path.split('?', 1)[0].split('/')
+    return '/'.join(ID_SEGMENT.sub('{id}', segment) for segment in segments)
+
+
+class Span(object):
+    __slots__ = ('method', 'path', 'status', 'attempts', 'sent', 'received',
+                 'started', 'phases')
+
+    def __init__(self, method, path):
+        """
+        The timings of one call to the API. "path" is the template of the
+        path, see "template". "phases" is a dictionary of phase name to
+        seconds, a phase that did not happen, IE "dns" on a reused connection,
+        is left out. "sent" and "received" are the bytes of the bodies.
+        """
+        self.method = method
+        self.path = template(path)
+        self.status = None
+        self.attempts = 0
+        self.sent = 0
+        self.received = 0
+        self.started = time.time()
+        self.phases = {}
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0) + seconds
+
+    def total(self):
+        return sum(self.phases.values())
+
+    def as_dict(self):
+        return {'method': self.method,
+                'path': self.path,
+                'status': self.status,
+                'attempts': self.attempts,
+                'sent': self.sent,
+                'received': self.received,
+                'started': self.started,
+                'phases': dict(self.phases)}
+
+
+class SpanCollector(object):
+    def __init__(self, max_spans=10000):
+        """
+        A span sink that keeps the last "max_spans" spans in memory, IE
+        "m_args['trace'] = tracing.SpanCollector()".
+        """
+        self.max_spans = max_spans
+        self.lock = threading.Lock()
+        self.spans = []
+
+    def __call__(self, span):
+        with self.lock:
+            self.spans.append(span)
+            if len(self.spans) > self.max_spans:
+                del self.spans[0]
+
+    def summary(self):
+        """
+        Return the number of calls and the total seconds spent in each phase
+        for each method and path template.
+        """
+        summary = {}
+        with self.lock:
+            spans = list(self.spans)
+        for span in spans:
+            entry = summary.setdefault('%s %s' % (span.method, span.path),
+                                       {'calls': 0, 'phases': {}})
+            entry['calls'] += 1
+            for phase, seconds in span.phases.items():
+                entry['phases'][phase] = (entry['phases'].get(phase, 0) +
+                                          seconds)
+        return summary
+
+
+def take_phases(conn):
+    """
+    Return, and forget, the connection phases recorded by a traced
+    connection since it was last asked.
+    """
+    phases = getattr(conn, 'phases', None)
+    conn.phases = None
+    return phases
+
+
+def _timed_connect(conn):
+    """
+    Open the socket for "conn", recording the time it took to resolve the
+    host and to connect to it.
+    """
+    conn.phases = {}
+    started = time.time()
+    addresses = socket.getaddrinfo(conn.host, conn.port, 0,
+                                   socket.SOCK_STREAM)
+    resolved = time.time()
+    conn.phases['dns'] = resolved - started
+
+    error = None
+    sock = None
+    for family, socktype, proto, _, address in addresses:
+        try:
+            sock = socket.socket(family, socktype, proto)
+            if conn.timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                sock.settimeout(conn.timeout)
+            if getattr(conn, 'source_address', None):
+                sock.bind(conn.source_address)
+            sock.connect(address)
+            break
+        except socket.error, exp:
+            error = exp
+            if sock is not None:
+                sock.close()
+            sock = None
+    if sock is None:
+        raise error or socket.error('getaddrinfo returns an empty list')
+    conn.sock = sock
+    conn.phases['connect'] = time.time() - resolved
+    if getattr(conn, '_tunnel_host', None):
+        conn._tunnel()
+
+
+class TracedHTTPConnection(httplib.HTTPConnection):
+    """
+    A HTTPConnection that records how long it took to connect.
+    """
+    phases = None
+
+    def connect(self):
+        _timed_connect(self)
+
+
+class TracedHTTPSConnection(httplib.HTTPSConnection):
+    """
+    A HTTPSConnection that records how long it took to connect and to set
+    up TLS.
+    """
+    phases = None
+
+    def connect(self):
+        _timed_connect(self)
+        started = time.time()
+        server_hostname = getattr(self, '_tunnel_host', None) or self.host
+        if hasattr(self, '_context'):
+            self.sock = self._context.wrap_socket(
+                self.sock,
+                server_hostname=server_hostname
+            )
+        else:
+            self.sock = ssl.wrap_socket(self.sock, self.key_file,
+                                        self.cert_file)
+        self.phases['tls'] = time.time() - started
@@ -0,0 +1,215 @@
+# ==============================================================================
+# Copyright [2013] [Kevin Carter]
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import Queue
+import sys
+import threading
+
+
+class Timeout(Exception):
+    pass
+
+
+class Future(object):
+    def __init__(self):
+        """
+        The result of a call that is running on a worker. Use "result()" to
+        wait for the value, any exception raised by the call is raised again
+        by "result()".
+        """
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+
+    def done(self):
+        return self._event.isSet()
+
+    def _finish(self):
+        with self._lock:
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def set_result(self, result):
+        self._result = result
+        self._finish()
+
+    def set_exception(self, exc_info):
+        self._exc_info = exc_info
+        self._finish()
+
+    def add_done_callback(self, callback):
+        """
+        Call "callback" with this future once it is done. If the future is
+        already done the callback is called right away.
+        """
+        with self._lock:
+            if not self._event.isSet():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def exception(self, timeout=None):
+        """
+        Wait for the call and return the exception it raised, if any.
+        """
+        if not self._event.wait(timeout) and not self.done():
+            raise Timeout('The call did not finish in %s seconds' % timeout)
+        if self._exc_info:
+            return self._exc_info[1]
+
+    def result(self, timeout=None):
+        """
+        Wait for the call and return its result.
+        """
+        if self.exception(timeout=timeout) is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+
+class WorkerPool(object):
+    def __init__(self, workers=10):
+        """
+        A bounded pool of threads that runs calls given to "submit()". At most
+        "workers" calls will run at the same time, the rest are queued. The
+        threads are started when the first call is submitted.
+        """
+        self.workers = workers
+        self.queue = Queue.Queue()
+        self.threads = []
+        self.lock = threading.Lock()
+
+    def _start(self):
+        with self.lock:
+            while len(self.threads) < self.workers:
+                thread = threading.Thread(target=self._worker)
+                thread.daemon = True
+                thread.start()
+                self.threads.append(thread)
+
+    def _worker(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            future, func, args, kwargs = job
+            try:
+                future.set_result(func(*args, **kwargs))
+            except Exception:
+                future.set_exception(sys.exc_info())
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queue "func" to be called with the given arguments and return a Future
+        for its result.
+        """
+        if not self.threads:
+            self._start()
+        future = Future()
+        self.queue.put((future, func, args, kwargs))
+        return future
+
+    def shutdown(self, wait=True):
+        """
+        Stop the workers once all of the queued calls are done.
+        """
+        with self.lock:
+            threads, self.threads = self.threads, []
+        for thread in threads:
+            self.queue.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.shutdown()
+
+
+def as_completed(futures, timeout=None):
+    """
+    Yield the futures in the order that they finish.
+    """
+    futures = list(futures)
+    finished = Queue.Queue()
+    for future in futures:
+        future.add_done_callback(finished.put)
+    for _ in futures:
+        try:
+            yield finished.get(timeout=timeout)
+        except Queue.Empty:
+            raise Timeout('No call finished in %s seconds' % timeout)
+
+
+def wait_all(futures, timeout=None):
+    """
+    Wait for all of the futures and return their results in order. An
+    exception raised by any call is raised here.
+    """
+    return [future.result(timeout=timeout) for future in futures]
+
+
+class BatchMap(object):
+    def __init__(self, func, items, pool, ordered=True, failed=None,
+                 shutdown=False, **kwargs):
+        """
+        Call "func" once for every item in "items" using the workers in "pool".
+        If an item is a tuple it is used as the positional arguments of the
+        call, "kwargs" are given to every call. Iterate over the BatchMap to
+        get "(item, result)" pairs, in the order of "items" if "ordered" is
+        True or in the order that the calls finish otherwise.
+
+        A call that raises does not stop the batch, the exception is stored in
+        "errors" under its item. If "failed" is a callable that returns True
+        for a result, the result is stored in "errors" as well. When
+        "shutdown" is True the pool is shutdown once all calls are queued.
+        """
+        self.errors = {}
+        self.failed = failed
+        self.ordered = ordered
+        self.futures = []
+        for item in items:
+            if isinstance(item, tuple):
+                args = item
+            else:
+                args = (item,)
+            future = pool.submit(func, *args, **kwargs)
+            self.futures.append((item, future))
+        if shutdown:
+            pool.shutdown(wait=False)
+
+    def __iter__(self):
+        if self.ordered:
+            finished = self.futures
+        else:
+            items = dict((id(future), item) for item, future in self.futures)
+            finished = ((items[id(future)], future) for future
+                        in as_completed(f for i, f in self.futures))
+
+        for item, future in finished:
+            try:
+                result = future.result()
+            except Exception, exp:
+                self.errors[item] = exp
+                continue
+            if self.failed is not None and self.failed(result):
+                self.errors[item] = result
+                continue
+            yield item, result
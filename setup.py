@@ -35,6 +35,9 @@ setuptools.setup(
     long_description=long_description,
     license=info.__license__,
     packages=['bookofnova'],
+    entry_points={
+        'console_scripts': ['bookofnova-run = bookofnova.runner:main']
+    },
     keywords='openstack, nova, compute, api, rackspace',
     url=info.__urlinformation__,
     classifiers=[